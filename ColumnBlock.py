@@ -0,0 +1,35 @@
+from array import array
+
+
+class ColumnBlock:
+    """
+    The columns of one model year table while its sheet is parsed. Every
+    column holds the codes of its values in an array of C unsigned ints,
+    the codes index the distinct values of the sheet that the parser keeps,
+    so a value repeated on every row (TBD, a date) is only stored once.
+    """
+
+    __slots__ = ('columns',)
+
+    def __init__(self):
+        # column name: codes of its values, in the order the columns appear in the table
+        self.columns = {}
+
+    # a new, empty column, a column name that repeats in the table starts over
+    def add_column(self, column_name):
+        self.columns[column_name] = array('I')
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, column_name):
+        return self.columns[column_name]
+
+    def __setitem__(self, column_name, codes):
+        self.columns[column_name] = codes
+
+    def keys(self):
+        return self.columns.keys()
+
+    def items(self):
+        return self.columns.items()
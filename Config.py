@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+import yaml
+
+
+# split a comma separated config value into a frozenset for quick membership tests
+def split_config_values(values):
+    return frozenset(value for value in values.split(', ') if value)
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Everything the scripts read from config.yaml, parsed once. The keyword
+    lists are kept as frozensets so the parsers can test cell values against
+    them without touching the file again.
+    """
+    path_to_main_excel: str
+    no_fuel_types: str
+    fuel_types: str
+    sub_fuel_types: str
+    break_keywords: frozenset
+    model_years: frozenset
+    removal_keywords: frozenset
+    database_details: dict
+    reader_engine: str = 'openpyxl'
+    fetch_size: int = 2000
+    sheets_to_skip: frozenset = frozenset(['Summary', 'Quarterly Summary', 'Sheet1'])
+
+    @classmethod
+    def from_yaml(cls, config_path='./config.yaml'):
+        with open(config_path, 'r') as yml_file:
+            cfg = yaml.safe_load(yml_file)
+        vehicle_line_types = cfg['vehicle line types']
+        return cls(path_to_main_excel=cfg['paths']['path to main csv'],
+                   no_fuel_types=vehicle_line_types['no fuel types'].strip(', '),
+                   fuel_types=vehicle_line_types['fuel types'].strip(', '),
+                   sub_fuel_types=vehicle_line_types['sub-fuel types'].strip(', '),
+                   break_keywords=split_config_values(cfg['values to compare']),
+                   model_years=split_config_values(cfg.get('model years', '22MY, 23MY, 24MY')),
+                   removal_keywords=split_config_values(cfg.get('values to remove',
+                                                                'Updates highlighted in orange, '
+                                                                'Past dates highlighted in gray, State and Local')),
+                   database_details=cfg['database_details'],
+                   reader_engine=cfg.get('reader engine', 'openpyxl'),
+                   fetch_size=int(cfg.get('fetch size', 2000)),
+                   sheets_to_skip=split_config_values(cfg.get('sheets to skip', 'Summary, Quarterly Summary, Sheet1')))
@@ -0,0 +1,53 @@
+import os
+import json
+import hashlib
+
+
+# the parts of the config that change what a sheet parses into
+def get_parse_settings(config):
+    return (config.no_fuel_types, config.fuel_types, config.sub_fuel_types,
+            sorted(config.break_keywords), sorted(config.model_years), sorted(config.removal_keywords))
+
+
+# fingerprint of the visible cell values of a sheet, together with the parse settings
+def get_sheet_fingerprint(session, sheet_name, config):
+    fingerprint = hashlib.sha256(repr(get_parse_settings(config)).encode('utf-8'))
+    for row_number, row_cells in session.iter_unhidden_cells(sheet_name):
+        fingerprint.update(repr((row_number, row_cells)).encode('utf-8'))
+        fingerprint.update(b'\n')
+    return fingerprint.hexdigest()
+
+
+class FingerprintCache:
+    """
+    Local sidecar file with the fingerprint of every sheet that was last
+    parsed successfully, and the csv it was saved to. A sheet whose
+    fingerprint has not changed does not need to be parsed again.
+    """
+
+    def __init__(self, cache_path='./sheet_fingerprints.json'):
+        self.cache_path = cache_path
+        self.entries = self.read_cache()
+
+    def read_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, 'r') as cache_file:
+            return json.load(cache_file)
+
+    def save(self):
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump(self.entries, cache_file, indent=2, sort_keys=True)
+
+    # the sheet is unchanged since its csv (or parquet file) was written, and the file is still there
+    def is_unchanged(self, vehicle_line_name, fingerprint, dir_to_save, file_format='csv'):
+        entry = self.entries.get(vehicle_line_name)
+        return (entry is not None and entry['fingerprint'] == fingerprint and entry['csv'].endswith('.' + file_format)
+                and os.path.exists(os.path.join(dir_to_save, entry['csv'])))
+
+    def set(self, vehicle_line_name, fingerprint, csv_name):
+        self.entries[vehicle_line_name] = {'fingerprint': fingerprint, 'csv': csv_name}
+
+    # fingerprint of the sheet each csv was written from
+    def get_fingerprints_by_csv(self):
+        return {entry['csv']: entry['fingerprint'] for entry in self.entries.values()}
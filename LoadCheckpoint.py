@@ -0,0 +1,58 @@
+import os
+import json
+import threading
+
+
+class LoadCheckpoint:
+    """
+    Local sidecar file with the tables that a run of updateDB.py has
+    loaded so far, written after every table. When the run is
+    interrupted, the next run with the same settings skips the tables
+    that were loaded, as long as their csv has not changed since. The
+    file is removed once a run has loaded every table.
+    """
+
+    def __init__(self, settings, checkpoint_path='./load_checkpoint.json'):
+        self.checkpoint_path = checkpoint_path
+        # how the tables were loaded (sync or reload, csv or parquet), a run with other settings starts over
+        self.settings = settings
+        self.loaded = self.read_checkpoint()
+        # the tables are loaded by a pool of threads
+        self.lock = threading.Lock()
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except ValueError:
+            return {}
+        if checkpoint.get('settings') != self.settings:
+            return {}
+        return checkpoint['loaded']
+
+    # the modification time and size of the csv, a csv written again after it was loaded is loaded again
+    def get_csv_stamp(self, csv):
+        stat = os.stat(csv)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def is_loaded(self, csv):
+        return self.loaded.get(os.path.basename(csv)) == self.get_csv_stamp(csv)
+
+    def mark_loaded(self, csv):
+        with self.lock:
+            self.loaded[os.path.basename(csv)] = self.get_csv_stamp(csv)
+            self.save()
+
+    # written to a temporary file first, so a run killed half way through a write leaves the last checkpoint
+    def save(self):
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({'settings': self.settings, 'loaded': self.loaded}, checkpoint_file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def clear(self):
+        self.loaded = {}
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
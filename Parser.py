@@ -1,24 +1,51 @@
+import sys
+from array import array
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import yaml
+from itertools import islice
+from functools import lru_cache
+from parquet_files import write_parquet
+from ColumnBlock import ColumnBlock
+from RunReport import RunReport
+
+
+# name of the csv (and of the table in DB) of a vehicle line
+def get_name_to_save(vehicle_line_name):
+    return vehicle_line_name.replace('-', '_').rstrip().replace(' ', '_').lower()
+
+
+# column names repeat across model years and vehicle lines, so normalize each one only once, and intern
+# it so the columns of every model year table share the same name
+@lru_cache(maxsize=None)
+def format_column_name(column_name):
+    if column_name in 'LPO Paint':
+        column_name = 'lpo_paint'
+    column_name = column_name.replace('S/L',
+                               'State & Local').replace('&', 'and').replace('Commerical',
+                                                                            'Commercial').replace('- ', "").replace(" -",
+                                                                                                  " ").replace("/",
+                                                                                            " or ").strip().replace(" ", '_').lower()
+    return sys.intern(column_name)
 
 
 class Parser:
-    def __init__(self, wb, vehicle_line_name, start_row=1):
+    def __init__(self, session, vehicle_line_name, config, start_row=1):
         self.vehicle_line_name = vehicle_line_name
-        self.df = self.get_unhidden_rows_from_df(wb, self.vehicle_line_name)
+        self.config = config
         self.start_row = start_row
+        # code of every distinct value of the sheet, the columns of the model year tables hold the codes
+        self.value_codes = {}
+        self.rows = self.get_unhidden_rows(session, self.vehicle_line_name)
+        self.header_rows = self.get_header_rows()
+
+    #   get a lazy stream of the values of unhidden rows from the sheet
+    def get_unhidden_rows(self, session, vehicle_line_name):
+        return session.iter_unhidden_rows(vehicle_line_name)
 
-    #   get unhidden rows from the sheet
-    def get_unhidden_rows_from_df(self, wb, vehicle_line_name):
-        ws = wb[vehicle_line_name]
-        data = []
-        for row in ws:
-            if ws.row_dimensions[row[0].row].hidden == False:
-                row_values = [cell.value for cell in row]
-                data.append(row_values)
-        df = pd.DataFrame(data)
-        return df
+    #   take the rows above the model year tables (vehicle line name, fuel types) off the stream
+    def get_header_rows(self):
+        return list(islice(self.rows, self.start_row))
 
     #   get vehicle name
     def get_vehicle_line_name(self, first_row_values):
@@ -29,14 +56,15 @@ class Parser:
         return vehicle_line_name
 
     # Creating main dict with model year(s) as keys and their
-    # respective values would be a subdictionary of columns and
-    # their values
+    # respective values would be a ColumnBlock of columns and
+    # the codes of their values
 
-    # initialize dictionary with model year
+    # initialize dictionary with model year, returns the model year if the row starts a new table
     def initialize_dict_with_model_year(self, first_value_of_row, total_dict):
-        if self.sanitize_row_value(first_value_of_row) in ('22MY', '23MY', '24MY'):
-            subdict = {}
-            total_dict[first_value_of_row.strip()] = subdict
+        if self.sanitize_row_value(first_value_of_row) in self.config.model_years:
+            model_year = first_value_of_row.strip()
+            total_dict[model_year] = ColumnBlock()
+            return model_year
 
     # check for None type row value
     def ensure_there_is_no_none_type(self, row_value):
@@ -51,13 +79,7 @@ class Parser:
 
     # format column names
     def format_column_names(self, column_name):
-        if column_name in 'LPO Paint':
-            column_name = 'lpo_paint'
-        return column_name.replace('S/L',
-                                   'State & Local').replace('&', 'and').replace('Commerical',
-                                                                                'Commercial').replace('- ', "").replace(" -",
-                                                                                                      " ").replace("/",
-                                                                                                " or ").strip().replace(" ", '_').lower()
+        return format_column_name(column_name)
 
     # check and convert datatime object
     def check_and_convert_datetime_object(self, row_value):
@@ -72,38 +94,32 @@ class Parser:
             subdict_key = self.format_column_names(row_value)
             return subdict_key
 
-    # initialize subdict with column names
-    def initialize_subdict_with_column_name(self, row, total_dict, subdict):
+    # initialize subdict with column names, returns the column the values of this row belong to
+    def initialize_subdict_with_column_name(self, row, subdict):
         for row_value in row[1:]: # column names are always at 1st index
             row_value = self.check_and_convert_datetime_object(row_value)
             if self.ensure_there_is_no_none_type(row_value):
                 subdict_key = self.format_column_names(row_value)
-                subdict[subdict_key] = []
-                break
+                subdict.add_column(subdict_key)
+                return subdict_key
 
-    # get column values
-    def append_list_of_column_values(self, row, total_dict, subdict):
+    # get column values, as the codes of the values
+    def append_list_of_column_values(self, row, subdict, subdict_key):
+        column_codes = subdict[subdict_key]
+        value_codes = self.value_codes
         for row_value in row[2:]:  # column values begin from 2nd index
             row_value = self.check_and_convert_datetime_object(row_value)
             if self.ensure_there_is_no_none_type(row_value):
-                subdict[list(subdict.keys())[-1]].append(row_value)
+                column_codes.append(value_codes.setdefault(row_value, len(value_codes)))
 
-    # get keywords to compare
-    def get_tuple_of_values_to_compare(self, main_dict_keys, config_path='./config.yaml'):
-        with open(config_path, 'r') as yml_file:
-            cfg = yaml.safe_load(yml_file)
-        values_to_compare = tuple(cfg['values to compare'].split(', '))
-        values_to_compare += tuple(main_dict_keys)
-        values_to_compare += tuple(['', ' '])
-        return values_to_compare
+    # compare with the break keywords from config, the model years already parsed and blank strings
+    def is_value_to_compare(self, row_value, main_dict_keys):
+        return row_value in self.config.break_keywords or row_value in main_dict_keys or row_value in ('', ' ')
 
     def check_to_break_main_loop(self, row, main_dict_keys):
-        values_to_compare = self.get_tuple_of_values_to_compare(main_dict_keys)
-        #values_to_compare = ('Down Weeks', 'Allocation Quarter', 'Constrained Commodity Information',
-                            # 'Constrained Commodity Information-Explorer', '', ' ') + tuple(main_dict_keys)
         for row_value in row:
             row_value = self.check_and_convert_datetime_object(row_value)
-            if self.sanitize_row_value(row_value) in values_to_compare:
+            if self.is_value_to_compare(self.sanitize_row_value(row_value), main_dict_keys):
                 return True
         return False
 
@@ -115,109 +131,155 @@ class Parser:
     # function to get dictionary
     def parser(self):
         main_dict = {}
-        subdict = {}
-        for row in self.df.values[self.start_row:]:
+        subdict = ColumnBlock()
+        model_year = None  # table being filled
+        subdict_key = None  # column being filled
+        for row in self.rows:
 
             if self.check_to_break_main_loop(row, main_dict.keys()):
-                if len(subdict.keys()) > 0:
-                    main_dict[list(main_dict.keys())[-1]] = subdict
+                if len(subdict) > 0:
+                    main_dict[model_year] = subdict
                 break
 
             if not self.is_empty_row(row):
-                self.initialize_dict_with_model_year(row[0], main_dict)
-                self.initialize_subdict_with_column_name(row, main_dict, subdict)
-                self.append_list_of_column_values(row, main_dict, subdict)
+                new_model_year = self.initialize_dict_with_model_year(row[0], main_dict)
+                if new_model_year is not None:
+                    model_year = new_model_year
+                new_subdict_key = self.initialize_subdict_with_column_name(row, subdict)
+                if new_subdict_key is not None:
+                    subdict_key = new_subdict_key
+                    self.append_list_of_column_values(row, subdict, subdict_key)
             else:
-                if len(subdict.keys()) > 0:
-                    main_dict[list(main_dict.keys())[-1]] = subdict
-                    subdict = {}
+                if len(subdict) > 0:
+                    main_dict[model_year] = subdict
+                    subdict = ColumnBlock()
 
         return main_dict
 
-    # Clean the dictionary, convert it to df,
+    # Clean the dictionary, fill the final df with it,
     # add model year and vehicle name columns
 
-    # remove unwanted keywords from the dictionary
-    def remove_extra_keywords_from_dict(self, subdict, subdict_key):
-        for value in subdict[subdict_key]:
-            if value.rstrip() in ('Updates highlighted in orange', 'Past dates highlighted in gray', 'State and Local') or value == ' ':
-                subdict[subdict_key].remove(value)
-
-    # convert the dict to df
-    def append_list_of_dfs(self, total_dict):
-        list_of_dfs = []
-        for key in total_dict.keys():
-            temp_df = pd.DataFrame.from_dict(total_dict[key], orient='index').transpose()
-            list_of_dfs.append(temp_df)
-        return list_of_dfs
-
-
-    def concatenate_dfs(self, list_of_dfs):
-        concatenated_df = pd.concat(list_of_dfs)
-        concatenated_df.reset_index(drop=True, inplace=True)
-        return concatenated_df
-
-    # to rearrange newly added columns
-    def rearrange_columns_in_concatenated_df(self, concatenated_df):
-        columns = concatenated_df.columns.tolist()
-        columns = columns[-1:] + columns[:-1]
-        concatenated_df = concatenated_df[columns]
-        return concatenated_df
-
-    # add model year to the concatenated df
-    def add_model_year_to_concatenated_df(self, concatenated_df, model_years_in_total_dict):
-        list_of_model_years = list(model_years_in_total_dict)
-        concatenated_df['model_year'] = list_of_model_years
-        concatenated_df = self.rearrange_columns_in_concatenated_df(concatenated_df)
-        return concatenated_df
-
-    # add vehicle line name in the concatenated df
-    def add_vehicle_line_name_to_concatenated_df(self, concatenated_df, vehicle_line_name):
-        vehicle_line_name_list_to_add = []
-        for i in range(len(concatenated_df)):
-            vehicle_line_name_list_to_add.append(vehicle_line_name)
-        concatenated_df['vehicle_line'] = vehicle_line_name_list_to_add
-        concatenated_df = self.rearrange_columns_in_concatenated_df(concatenated_df)
-        return concatenated_df
-
-    # add sno, lastly
-    def add_sno_in_concatenated_df(self, concatenated_df):
-        sno_list = []
-        for index in range(len(concatenated_df)):
-            sno_list.append(index)
-        concatenated_df['sno'] = sno_list
-        concatenated_df = self.rearrange_columns_in_concatenated_df(concatenated_df)
-        return concatenated_df
-
-    # add serial key to be used as a primary key in DB
-    def add_serial_key(self, concatenated_df):
-        serial_keys = []
-        for row in concatenated_df.values:
-            serial_key = row[0].lower().replace(' ', '_') + '_' + row[1]  # at index 0, vehicle line name exists
-                                                                        # at index 1, model year exists
-            serial_keys.append(serial_key)
-        concatenated_df['serial_key'] = serial_keys
-        concatenated_df = self.rearrange_columns_in_concatenated_df(concatenated_df)
-        return concatenated_df
+    # check for a note from the sheet (or a blank) that is not part of the table
+    def is_extra_keyword(self, value):
+        return value.rstrip() in self.config.removal_keywords or value == ' '
+
+    # the distinct values of the sheet by their code, followed by the empty string that fills the missing cells
+    def get_values_by_code(self):
+        values_by_code = np.empty(len(self.value_codes) + 1, dtype=object)
+        values_by_code[:-1] = list(self.value_codes)
+        values_by_code[-1] = ''
+        return values_by_code
+
+    # codes of the notes from the sheet (and the blanks), every distinct value is checked only once
+    def get_extra_codes(self):
+        return {code for value, code in self.value_codes.items() if self.is_extra_keyword(value)}
+
+    # remove unwanted keywords from a column, only a column that has one is copied
+    def remove_extra_keywords_from_dict(self, subdict, subdict_key, extra_codes):
+        column_codes = subdict[subdict_key]
+        if not extra_codes.isdisjoint(column_codes):
+            subdict[subdict_key] = array('I', (code for code in column_codes if code not in extra_codes))
+
+    # rows of every model year table, as many as its longest column
+    def get_num_of_rows_of_tables(self, main_dict):
+        return [max((len(column_codes) for _, column_codes in subdict.items()), default=0)
+                for subdict in main_dict.values()]
+
+    # get list of values for model year column, one per model year table
+    def get_model_year_column_values_list(self, model_years_in_dict):
+        return np.array(model_years_in_dict, dtype=object)
+
+    # get vehicle line name column values, the same name for every row
+    def get_vehicle_line_name_column_values(self, num_of_rows):
+        return np.full(num_of_rows, self.vehicle_line_name, dtype=object)
+
+    # columns added in front of the table columns, in the order they appear in the csv
+    def get_columns_to_add(self, num_of_rows, model_years_in_dict):
+        columns_to_add = {}
+        columns_to_add['vehicle_line'] = self.get_vehicle_line_name_column_values(num_of_rows)
+        columns_to_add['model_year'] = self.get_model_year_column_values_list(model_years_in_dict)
+        return columns_to_add
+
+    # serial key to be used as a primary key in DB: the vehicle line name followed by
+    # the rest of the added columns (fuel type, sub fuel type, model year), joined by '_'
+    def get_serial_key_column_values(self, columns_to_add):
+        serial_keys = self.vehicle_line_name.lower().replace(' ', '_')
+        for column, column_values in columns_to_add.items():
+            if column != 'vehicle_line':
+                serial_keys = serial_keys + '_' + column_values
+        return serial_keys
+
+    # the final df in one preallocated array, the serial key and the other added columns in front of the
+    # table columns. A table column with the name of an added column is replaced by it
+    def get_final_df(self, main_dict, num_of_rows_of_tables, columns_to_add, values_by_code):
+        num_of_rows = sum(num_of_rows_of_tables)
+        columns_to_add = {'serial_key': self.get_serial_key_column_values(columns_to_add), **columns_to_add}
+        column_names = dict.fromkeys(column for subdict in main_dict.values() for column in subdict.keys())
+        table_columns = [column for column in column_names if column not in columns_to_add]
+        positions = {column: position for position, column in enumerate(table_columns, len(columns_to_add))}
+        # a row of the array per column of the df, so every column is filled as one contiguous run
+        frame_values = np.empty((len(positions) + len(columns_to_add), num_of_rows), dtype=object)
+        for position, (column, column_values) in enumerate(columns_to_add.items()):
+            if len(column_values) != num_of_rows:
+                raise ValueError(f'Length of values ({len(column_values)}) of column {column} does not match '
+                                 f'the number of rows ({num_of_rows})')
+            frame_values[position] = column_values
+        # the cells a table does not fill are empty
+        frame_values[len(columns_to_add):] = values_by_code[-1]
+        first_row = 0
+        for subdict, num_of_rows_of_table in zip(main_dict.values(), num_of_rows_of_tables):
+            for column, column_codes in subdict.items():
+                if column in positions:
+                    np.take(values_by_code, np.frombuffer(column_codes, dtype=np.uintc), mode='clip',
+                            out=frame_values[positions[column], first_row:first_row + len(column_codes)])
+            first_row += num_of_rows_of_table
+        # the transpose is a view, the df is built on frame_values without a copy
+        return pd.DataFrame(frame_values.T, columns=list(columns_to_add) + table_columns, copy=False)
 
     # function for postprocessing the dictionary
     def postprocess_dictionary(self, main_dict):
+        if not main_dict:
+            raise ValueError('No model year tables found in the sheet')
+        extra_codes = self.get_extra_codes()
         for model_year in main_dict.keys():
             subdict = main_dict[model_year]
             for column in subdict.keys():
-                self.remove_extra_keywords_from_dict(subdict, column)
-        list_of_dfs = self.append_list_of_dfs(main_dict)
-        concatenated_df = self.concatenate_dfs(list_of_dfs)
-        concatenated_df = self.add_model_year_to_concatenated_df(concatenated_df, main_dict.keys())
-        concatenated_df = self.add_vehicle_line_name_to_concatenated_df(concatenated_df, self.vehicle_line_name)
-        concatenated_df = self.add_serial_key(concatenated_df)
-        concatenated_df.fillna('', inplace=True)
-        return concatenated_df
-
-    def run(self, dir_to_save):
-        name_to_save = self.vehicle_line_name.replace('-', '_').rstrip().replace(' ', '_').lower()
-        dictionary_after_parsing = self.parser()
-        final_df = self.postprocess_dictionary(dictionary_after_parsing)
-        final_df.to_csv(dir_to_save + name_to_save + '.csv', index=False)
+                self.remove_extra_keywords_from_dict(subdict, column, extra_codes)
+        num_of_rows_of_tables = self.get_num_of_rows_of_tables(main_dict)
+        columns_to_add = self.get_columns_to_add(sum(num_of_rows_of_tables), list(main_dict.keys()))
+        return self.get_final_df(main_dict, num_of_rows_of_tables, columns_to_add, self.get_values_by_code())
+
+    # name of the csv (and of the table in DB) of this vehicle line
+    def get_name_to_save(self):
+        return get_name_to_save(self.vehicle_line_name)
+
+    # name of the file the final df is saved to, in the given format (csv or parquet)
+    def get_file_name(self, file_format='csv'):
+        return self.get_name_to_save() + '.' + file_format
+
+    # save the final df as a csv, or as a parquet file with typed columns
+    def save_final_df(self, final_df, dir_to_save, file_format='csv'):
+        path = dir_to_save + self.get_file_name(file_format)
+        if file_format == 'parquet':
+            write_parquet(final_df, path)
+        else:
+            final_df.to_csv(path, index=False)
+
+    # parse the sheet and return the final df, the file is only written when a directory is given.
+    # every stage is recorded in the report, if one is given
+    def run(self, dir_to_save=None, file_format='csv', report=None):
+        report = report if report is not None else RunReport()
+        with report.stage(self.vehicle_line_name, 'parser') as record:
+            dictionary_after_parsing = self.parser()
+            # every milestone row of a model year table becomes a column
+            record['rows'] = sum(len(subdict) for subdict in dictionary_after_parsing.values())
+        with report.stage(self.vehicle_line_name, 'postprocess_dictionary') as record:
+            final_df = self.postprocess_dictionary(dictionary_after_parsing)
+            report.set_shape(record, final_df)
+        if dir_to_save is not None:
+            with report.stage(self.vehicle_line_name, file_format + ' write') as record:
+                self.save_final_df(final_df, dir_to_save, file_format)
+                report.set_shape(record, final_df)
+        return final_df
 
 
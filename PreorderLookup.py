@@ -0,0 +1,217 @@
+import os
+import glob
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+import psycopg2.sql as sql
+from parquet_files import read_parquet_as_text
+from updateDB import FINGERPRINT_TABLE, get_columns_of_tables, get_date_columns_of_table, get_text_columns_sql
+
+# the columns of the composite index, None in their place for a sheet that does not have one of them
+INDEX_COLUMNS = ('vehicle_line', 'model_year', 'fuel_type')
+
+
+def get_file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# the parsed table as main.py saved it, every value a string and empty cells empty strings
+def read_parsed_table(path):
+    if path.endswith('.parquet'):
+        return read_parquet_as_text(path)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+# the rows of a table in the database like in the csvs: every value as text, NULLs as empty strings, and the
+# date columns of a --typed-dates load merged back with their note columns
+def read_db_table(connection, tbl_name):
+    cursor = connection.cursor()
+    columns = get_columns_of_tables(cursor, [tbl_name]).get(tbl_name, [])
+    date_columns = get_date_columns_of_table(cursor, tbl_name)
+    cursor.execute(sql.SQL("SELECT {columns} FROM {tbl_name}").format(
+        columns=get_text_columns_sql(columns, date_columns), tbl_name=sql.Identifier(tbl_name)))
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, ['' if value is None else str(value) for value in row])) for row in cursor.fetchall()]
+
+
+def get_index_key(row):
+    return tuple(row.get(column) for column in INDEX_COLUMNS)
+
+
+class PreorderLookup:
+    """
+    The parsed tables of every vehicle line, loaded once from the csvs (or
+    parquet files) main.py writes, and looked up in memory: by serial_key
+    through a hash index, and by vehicle line, model year and fuel type
+    through a composite index. The results of the filters are kept in an
+    LRU cache. A file written again by main.py is loaded again on the next
+    check, and the cached results it can change are dropped.
+
+    With a connection the tables are read from the database instead, and a
+    table is read again when its loaded_at in sheet_fingerprints changes,
+    which every loader (updateDB.py, pipeline.py, watch.py) sets when it
+    commits the table.
+
+    The rows are shared between the lookups and the cache, they must not
+    be modified.
+    """
+
+    def __init__(self, dir_to_load='./csvs_generated', file_format='csv', cache_size=4096, check_interval=1.0,
+                 connection=None):
+        self.dir_to_load = dir_to_load
+        self.file_format = file_format
+        self.connection = connection
+        self.cache_size = cache_size
+        # seconds between two checks of the files (or of sheet_fingerprints), None to only check on refresh()
+        self.check_interval = check_interval
+        # by table name, the stamp of the file (or the load) it was loaded from and its rows
+        self.stamps = {}
+        self.rows_of_tables = {}
+        self.rows_by_serial_key = {}
+        self.rows_by_index_key = {}
+        self.index_keys_by_vehicle_line = {}
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.checked_at = None
+        # the lookups can come from the threads of lookup_server.py
+        self.lock = threading.RLock()
+        self.refresh()
+
+    def get_tbl_name(self, path):
+        return "preorder_" + os.path.splitext(os.path.basename(path))[0]
+
+    # table name -> path of every file to load
+    def get_paths(self):
+        return {self.get_tbl_name(path): path
+                for path in glob.glob(os.path.join(self.dir_to_load, '*.' + self.file_format))}
+
+    # table name -> when it was last loaded into the database, the tables stay as they are if it cannot be read
+    def get_loaded_at(self):
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"SELECT table_name, loaded_at FROM {FINGERPRINT_TABLE}")
+            return dict(cursor.fetchall())
+        except Exception as error:
+            print(f'Cannot read {FINGERPRINT_TABLE}, error: {error}')
+            return None
+        finally:
+            self.end_transaction()
+
+    # every check sees the tables committed since the last one
+    def end_transaction(self):
+        if not self.connection.closed:
+            self.connection.rollback()
+
+    # the stamp and the rows of a table, from its file or from the database
+    def read_table(self, tbl_name, source):
+        if self.connection is None:
+            stamp = get_file_stamp(source)
+            if self.stamps.get(tbl_name) == stamp:
+                return stamp, None
+            return stamp, read_parsed_table(source).to_dict('records')
+        if self.stamps.get(tbl_name) == source:
+            return source, None
+        try:
+            return source, read_db_table(self.connection, tbl_name)
+        finally:
+            self.end_transaction()
+
+    # load the tables that are new or were written again since the last check, returns the tables loaded
+    def refresh(self):
+        with self.lock:
+            self.checked_at = time.monotonic()
+            # the path of every file, or when every table was loaded into the database
+            sources = self.get_paths() if self.connection is None else self.get_loaded_at()
+            if sources is None:
+                return []
+            changed_tables = []
+            for tbl_name, source in sorted(sources.items()):
+                try:
+                    stamp, rows = self.read_table(tbl_name, source)
+                except Exception as error:
+                    # most likely the file is being written, the table stays as it is until the next check
+                    print(f'Cannot load {tbl_name}, error: {error}')
+                    continue
+                if rows is None:
+                    continue
+                self.set_table(tbl_name, rows, stamp)
+                changed_tables.append(tbl_name)
+            for tbl_name in sorted(set(self.rows_of_tables) - set(sources)):
+                self.set_table(tbl_name, None, None)
+                changed_tables.append(tbl_name)
+            if changed_tables:
+                self.rows_by_index_key = self.get_rows_by_index_key()
+                self.index_keys_by_vehicle_line = {}
+                for index_key in self.rows_by_index_key:
+                    self.index_keys_by_vehicle_line.setdefault(index_key[0], []).append(index_key)
+            return changed_tables
+
+    def refresh_if_due(self):
+        if self.check_interval is not None and time.monotonic() - self.checked_at >= self.check_interval:
+            self.refresh()
+
+    # replace the rows of a table, None removes the table
+    def set_table(self, tbl_name, rows, stamp):
+        old_rows = self.rows_of_tables.pop(tbl_name, [])
+        self.stamps.pop(tbl_name, None)
+        for row in old_rows:
+            self.rows_by_serial_key.pop(row['serial_key'], None)
+        if rows is not None:
+            self.rows_of_tables[tbl_name] = rows
+            self.stamps[tbl_name] = stamp
+            self.rows_by_serial_key.update((row['serial_key'], row) for row in rows)
+        self.invalidate({row.get('vehicle_line') for row in old_rows + (rows or [])})
+
+    # rebuilt from the tables when one of them changes, the rows stay in the order of their tables
+    def get_rows_by_index_key(self):
+        rows_by_index_key = {}
+        for tbl_name in sorted(self.rows_of_tables):
+            for row in self.rows_of_tables[tbl_name]:
+                rows_by_index_key.setdefault(get_index_key(row), []).append(row)
+        return rows_by_index_key
+
+    # drop the cached results that the rows of these vehicle lines can be part of
+    def invalidate(self, vehicle_line_values):
+        for cache_key in list(self.cache):
+            if cache_key[0] is None or cache_key[0] in vehicle_line_values:
+                del self.cache[cache_key]
+
+    # the row of a serial_key, or None
+    def get(self, serial_key):
+        with self.lock:
+            self.refresh_if_due()
+            return self.rows_by_serial_key.get(serial_key)
+
+    # the rows with these values, a value left out (None) matches every row
+    def find(self, vehicle_line=None, model_year=None, fuel_type=None):
+        cache_key = (vehicle_line, model_year, fuel_type)
+        with self.lock:
+            self.refresh_if_due()
+            rows = self.cache.get(cache_key)
+            if rows is not None:
+                self.cache.move_to_end(cache_key)
+                self.hits += 1
+                return rows
+            self.misses += 1
+            if None not in cache_key:
+                rows = tuple(self.rows_by_index_key.get(cache_key, ()))
+            else:
+                # only the distinct keys of the index are scanned, those of the vehicle line if there is one
+                index_keys = (self.rows_by_index_key if vehicle_line is None
+                              else self.index_keys_by_vehicle_line.get(vehicle_line, ()))
+                rows = tuple(row for index_key in index_keys
+                             if all(value is None or value == key_value
+                                    for value, key_value in zip(cache_key, index_key))
+                             for row in self.rows_by_index_key[index_key])
+            self.cache[cache_key] = rows
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return rows
+
+    def cache_info(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.cache), 'max_size': self.cache_size,
+                    'tables': len(self.rows_of_tables), 'rows': len(self.rows_by_serial_key)}
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+
+class RunReport:
+    """
+    Records the wall time, the rows and columns processed and the peak memory
+    delta of every stage of every vehicle line, and writes them as JSON lines,
+    one line per stage, appended to report_path. A disabled report (no path)
+    records nothing and costs nothing, it is what the scripts use by default.
+
+    The report can also profile a single vehicle line with cProfile, the stats
+    are dumped next to the report as profile_<vehicle line>_<script>.prof.
+    """
+
+    def __init__(self, report_path=None, script=None, profile_vehicle_line=None, track_memory=True):
+        self.report_path = report_path
+        self.script = script
+        self.profile_vehicle_line = profile_vehicle_line
+        self.enabled = report_path is not None
+        # the peak memory of a stage is only its own when the stages do not run at the same time
+        self.track_memory = self.enabled and track_memory
+        self.run_id = uuid.uuid4().hex
+        self.records = []
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    #   time a stage of a vehicle line, the caller can add the rows and columns it processed to the yielded record
+    @contextmanager
+    def stage(self, vehicle_line_name, stage):
+        if not self.enabled:
+            yield {}
+            return
+        record = {'run_id': self.run_id, 'script': self.script, 'vehicle_line': vehicle_line_name, 'stage': stage,
+                  'started_at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                  'rows': None, 'columns': None}
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start_time, 6)
+            record['peak_memory_delta'] = (tracemalloc.get_traced_memory()[1] - memory_before
+                                           if self.track_memory else None)
+            self.records.append(record)
+
+    #   record the shape of a df as the rows and columns of a stage
+    def set_shape(self, record, df):
+        if self.enabled:
+            record['rows'], record['columns'] = df.shape
+
+    #   profile the block if it is the vehicle line asked for
+    def profile(self, vehicle_line_name):
+        if vehicle_line_name != self.profile_vehicle_line:
+            return nullcontext()
+        return self.profile_to_file(vehicle_line_name)
+
+    @contextmanager
+    def profile_to_file(self, vehicle_line_name):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profile_dir = os.path.dirname(self.report_path) if self.report_path else '.'
+            profile_path = os.path.join(profile_dir or '.',
+                                        f'profile_{vehicle_line_name.replace(" ", "_")}_{self.script}.prof')
+            profiler.dump_stats(profile_path)
+            print(f'profile of {vehicle_line_name} saved to {profile_path}, the slowest calls:')
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+    #   records made by another process (see main.py --workers), they become part of this run
+    def add_records(self, records):
+        for record in records:
+            record['run_id'] = self.run_id
+            self.records.append(record)
+
+    def save(self):
+        if not self.enabled:
+            return
+        with open(self.report_path, 'a') as report_file:
+            for record in self.records:
+                report_file.write(json.dumps(record) + '\n')
+        print(f'run report: {len(self.records)} stages appended to {self.report_path}')
+        # a long running script saves the report more than once, every record is only written once
+        self.records = []
@@ -0,0 +1,48 @@
+from itertools import groupby
+from openpyxl import load_workbook
+
+
+class WorkbookSession:
+    """
+    Opens the main excel file once and hands out its worksheets on demand,
+    so every vehicle line parser can share the same loaded workbook.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.wb = load_workbook(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    #   get the worksheet of a vehicle line
+    def get_worksheet(self, sheet_name):
+        return self.wb[sheet_name]
+
+    #   lazily yield the values of the unhidden rows of a worksheet, top to bottom
+    def iter_unhidden_rows(self, sheet_name):
+        ws = self.get_worksheet(sheet_name)
+        for row_number, row_values in enumerate(ws.iter_rows(values_only=True), start=1):
+            if ws.row_dimensions[row_number].hidden == False:
+                yield row_values
+
+    #   yield the non-empty cells of every unhidden row as (row number, [(column number, value), ...]),
+    #   without creating all the empty cells in between like iterating the whole sheet does
+    def iter_unhidden_cells(self, sheet_name):
+        ws = self.get_worksheet(sheet_name)
+        cells = sorted(((coordinate, cell.value) for coordinate, cell in ws._cells.items() if cell.value is not None),
+                       key=lambda item: item[0])
+        for row_number, row_cells in groupby(cells, key=lambda item: item[0][0]):
+            if ws.row_dimensions[row_number].hidden == False:
+                yield row_number, [(column, value) for (_, column), value in row_cells]
+
+    #   drop a worksheet we are done with so its cells can be freed
+    def release(self, sheet_name):
+        if sheet_name in self.wb.sheetnames:
+            self.wb.remove(self.wb[sheet_name])
+
+    def close(self):
+        self.wb.close()
@@ -0,0 +1,258 @@
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+ROW_TAG = MAIN_NS + 'row'
+CELL_TAG = MAIN_NS + 'c'
+VALUE_TAG = MAIN_NS + 'v'
+FORMULA_TAG = MAIN_NS + 'f'
+TEXT_TAG = MAIN_NS + 't'
+RICH_TEXT_TAG = MAIN_NS + 'r'
+INLINE_STRING_TAG = MAIN_NS + 'is'
+SHARED_STRING_TAG = MAIN_NS + 'si'
+SHEET_DATA_TAG = MAIN_NS + 'sheetData'
+
+
+# text of a shared or inline string without its formatting, and without the phonetic runs
+def get_string_content(element):
+    snippets = []
+    plain = element.find(TEXT_TAG)
+    if plain is not None and plain.text is not None:
+        snippets.append(plain.text)
+    for run in element.findall(RICH_TEXT_TAG):
+        text = run.findtext(TEXT_TAG)
+        if text is not None:
+            snippets.append(text)
+    return ''.join(snippets)
+
+
+# Excel writes numbers without a decimal point or exponent for integers
+def cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+# true for the attribute values Excel uses for a set flag
+def is_true(value):
+    return value in ('1', 'true')
+
+
+class XlsxStreamSession:
+    """
+    Same interface as WorkbookSession, but reads the sheets straight from
+    the xlsx zip with an incremental XML parser instead of loading the whole
+    workbook into openpyxl cells. A sheet is only read while its rows are
+    being consumed, and is never kept in memory.
+
+    Cell values come out the way openpyxl gives them: shared strings, ints
+    and floats, datetimes for numbers with a date style and '=' + text for
+    formulas. Rows are not padded with empty cells past their last cell.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.zip_file = zipfile.ZipFile(path)
+        self.workbook_path = self.get_workbook_path()
+        self.workbook_rels = self.read_rels(self.workbook_path)
+        self.sheet_paths, self.epoch = self.read_workbook()
+        self.date_styles, self.timedelta_styles = self.read_styles()
+        self._shared_strings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    #   path of the workbook part inside the zip, from the package relationships
+    def get_workbook_path(self):
+        for rel in ET.fromstring(self.zip_file.read('_rels/.rels')).iter(PACKAGE_REL_NS + 'Relationship'):
+            if rel.get('Type').endswith('/officeDocument'):
+                return rel.get('Target').lstrip('/')
+        return 'xl/workbook.xml'
+
+    #   relationship id -> (type, path in the zip) of a part
+    def read_rels(self, part_path):
+        part_dir, part_name = posixpath.split(part_path)
+        rels_path = posixpath.join(part_dir, '_rels', part_name + '.rels')
+        rels = {}
+        if rels_path not in self.zip_file.namelist():
+            return rels
+        for rel in ET.fromstring(self.zip_file.read(rels_path)).iter(PACKAGE_REL_NS + 'Relationship'):
+            target = rel.get('Target')
+            if target.startswith('/'):
+                target = target.lstrip('/')
+            else:
+                target = posixpath.normpath(posixpath.join(part_dir, target))
+            rels[rel.get('Id')] = (rel.get('Type'), target)
+        return rels
+
+    #   path of the first part of a relationship type, like the shared strings or the styles
+    def get_part_path(self, rel_type, default):
+        for part_type, target in self.workbook_rels.values():
+            if part_type.endswith('/' + rel_type):
+                return target
+        return default
+
+    #   sheet name -> sheet xml path, and the date system of the workbook
+    def read_workbook(self):
+        workbook = ET.fromstring(self.zip_file.read(self.workbook_path))
+        sheet_paths = {}
+        for sheet in workbook.iter(MAIN_NS + 'sheet'):
+            sheet_paths[sheet.get('name')] = self.workbook_rels[sheet.get(REL_NS + 'id')][1]
+        workbook_properties = workbook.find(MAIN_NS + 'workbookPr')
+        if workbook_properties is not None and is_true(workbook_properties.get('date1904')):
+            return sheet_paths, CALENDAR_MAC_1904
+        return sheet_paths, CALENDAR_WINDOWS_1900
+
+    #   indexes of the cell styles whose number format shows a date, and of those showing a duration
+    def read_styles(self):
+        styles_path = self.get_part_path('styles', 'xl/styles.xml')
+        date_styles, timedelta_styles = set(), set()
+        if styles_path not in self.zip_file.namelist():
+            return date_styles, timedelta_styles
+        styles = ET.fromstring(self.zip_file.read(styles_path))
+        custom_formats = {int(num_fmt.get('numFmtId')): num_fmt.get('formatCode')
+                          for num_fmt in styles.iter(MAIN_NS + 'numFmt')}
+        cell_styles = styles.find(MAIN_NS + 'cellXfs')
+        if cell_styles is None:
+            return date_styles, timedelta_styles
+        for style_id, style in enumerate(cell_styles.findall(MAIN_NS + 'xf')):
+            num_fmt_id = int(style.get('numFmtId', 0))
+            number_format = custom_formats.get(num_fmt_id, BUILTIN_FORMATS.get(num_fmt_id))
+            if is_date_format(number_format):
+                date_styles.add(style_id)
+            if is_timedelta_format(number_format):
+                timedelta_styles.add(style_id)
+        return date_styles, timedelta_styles
+
+    #   the shared strings table, read once the first time a sheet needs it
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = self.read_shared_strings()
+        return self._shared_strings
+
+    def read_shared_strings(self):
+        strings_path = self.get_part_path('sharedStrings', 'xl/sharedStrings.xml')
+        strings = []
+        if strings_path not in self.zip_file.namelist():
+            return strings
+        with self.zip_file.open(strings_path) as strings_file:
+            for _, element in ET.iterparse(strings_file):
+                if element.tag == SHARED_STRING_TAG:
+                    strings.append(get_string_content(element).replace('x005F_', ''))
+                    element.clear()
+        return strings
+
+    #   value of a cell, converted like openpyxl converts it
+    def get_cell_value(self, cell, shared_formulae):
+        data_type = cell.get('t', 'n')
+        formula = cell.find(FORMULA_TAG)
+        if formula is not None:
+            return self.get_formula(cell, formula, shared_formulae)
+
+        if data_type == 'inlineStr':
+            inline_string = cell.find(INLINE_STRING_TAG)
+            return get_string_content(inline_string) if inline_string is not None else None
+
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if data_type == 'n':
+            value = cast_number(value)
+            style_id = int(cell.get('s', 0))
+            if style_id in self.date_styles:
+                try:
+                    return from_excel(value, self.epoch, timedelta=style_id in self.timedelta_styles)
+                except (OverflowError, ValueError):
+                    return '#VALUE!'
+            return value
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+    #   formulas are kept as text, shared formulas are moved to the cell they are used in
+    def get_formula(self, cell, formula, shared_formulae):
+        value = '=' + (formula.text or '')
+        if formula.get('t') == 'shared':
+            shared_index = formula.get('si')
+            if shared_index in shared_formulae:
+                return shared_formulae[shared_index].translate_formula(cell.get('r'))
+            if value != '=':
+                shared_formulae[shared_index] = Translator(value, cell.get('r'))
+        return value
+
+    #   yield (row number, hidden, [(column number, value), ...]) for every row element of a sheet,
+    #   freeing each row once it is read
+    def iter_sheet_rows(self, sheet_name):
+        shared_formulae = {}
+        row_number = 0
+        sheet_data = None
+        with self.zip_file.open(self.sheet_paths[sheet_name]) as sheet_file:
+            for event, element in ET.iterparse(sheet_file, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != ROW_TAG:
+                    continue
+                row_number = int(element.get('r', row_number + 1))
+                column = 0
+                row_cells = []
+                for cell in element.iter(CELL_TAG):
+                    coordinate = cell.get('r')
+                    column = coordinate_to_tuple(coordinate)[1] if coordinate else column + 1
+                    row_cells.append((column, self.get_cell_value(cell, shared_formulae)))
+                yield row_number, is_true(element.get('hidden')), row_cells
+                element.clear()
+                if sheet_data is not None:
+                    sheet_data.remove(element)
+
+    #   lazily yield the values of the unhidden rows of a worksheet, top to bottom,
+    #   starting at the first row and stopping at the last row with cells like openpyxl does
+    def iter_unhidden_rows(self, sheet_name):
+        hidden_rows = set()
+        next_row_number = 1
+        for row_number, hidden, row_cells in self.iter_sheet_rows(sheet_name):
+            if hidden:
+                hidden_rows.add(row_number)
+            if not row_cells:
+                continue
+            # rows without cells in between are empty
+            for empty_row_number in range(next_row_number, row_number):
+                if empty_row_number not in hidden_rows:
+                    yield ()
+            next_row_number = row_number + 1
+            if not hidden:
+                row_values = [None] * max(column for column, _ in row_cells)
+                for column, value in row_cells:
+                    row_values[column - 1] = value
+                yield tuple(row_values)
+
+    #   yield the non-empty cells of every unhidden row as (row number, [(column number, value), ...])
+    def iter_unhidden_cells(self, sheet_name):
+        for row_number, hidden, row_cells in self.iter_sheet_rows(sheet_name):
+            row_cells = [(column, value) for column, value in row_cells if value is not None]
+            if row_cells and not hidden:
+                yield row_number, row_cells
+
+    #   nothing of a sheet is kept once its rows are read
+    def release(self, sheet_name):
+        pass
+
+    def close(self):
+        self.zip_file.close()
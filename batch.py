@@ -0,0 +1,302 @@
+import os
+import glob
+import time
+import argparse
+import traceback
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import psycopg2
+import psycopg2.sql as sql
+from psycopg2.extras import execute_values
+from tqdm import tqdm
+from utilities import load_config, open_workbook_session, get_snapshot_date
+from main import get_vehicle_lines, get_parser_obj
+from updateDB import UpdateDB, get_connection_params, get_db_column_name, get_row_hash
+
+"""
+Batch mode for a directory of weekly workbook snapshots ("FDNB 2309 3.03.2023.xlsx", the date in the
+file name is month.day.year):
+    1. The snapshots that are not loaded yet are parsed in parallel, one worker process per snapshot.
+    2. Every vehicle line goes to a history table, preorder_<vehicle line>_history, in which every row
+       version is kept once with the dates it was valid for: from valid_from (the first snapshot it is in)
+       until valid_to (the first snapshot it is not in anymore, NULL while it still is).
+    3. A row that is the same as in the previous snapshot is not stored again.
+    4. All the history tables and the list of loaded snapshots are committed together, or not at all. A
+       sheet of a snapshot that cannot be parsed fails the whole batch, like a table that fails to load.
+The rows of a table as they were in the snapshot of a date:
+    SELECT * FROM preorder_aviator_history WHERE valid_from <= '2023-03-03' AND (valid_to IS NULL OR valid_to > '2023-03-03')
+"""
+
+# dates of the snapshots loaded into the history tables
+SNAPSHOT_TABLE = 'preorder_snapshots'
+
+# columns every history table has in front of the columns of the sheet
+VERSION_COLUMNS = ['serial_key', 'valid_from', 'valid_to', 'row_hash']
+
+
+def create_snapshot_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} ("
+                   "snapshot_date date PRIMARY KEY, "
+                   "file_name character varying NOT NULL, "
+                   "loaded_at timestamp with time zone NOT NULL DEFAULT now())")
+    connection.commit()
+
+
+def get_loaded_snapshot_dates(connection):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT snapshot_date FROM {SNAPSHOT_TABLE}")
+    loaded_snapshot_dates = {row[0] for row in cursor.fetchall()}
+    connection.commit()
+    return loaded_snapshot_dates
+
+
+def record_snapshots(cursor, snapshots):
+    execute_values(cursor, f"INSERT INTO {SNAPSHOT_TABLE} (snapshot_date, file_name) VALUES %s",
+                   [(snapshot_date, os.path.basename(path)) for snapshot_date, path in snapshots])
+
+
+# content hash of a row of a sheet, empty cells are left out so a new empty column does not make a new version
+def get_version_hash(row):
+    return get_row_hash([part for column, value in sorted(row.items()) if value not in ('', None)
+                         for part in (column, value)])
+
+
+class UpdateHistoryDB(UpdateDB):
+    """
+    Loads the snapshots of one vehicle line into its history table. The
+    snapshots are applied in date order in memory, against the versions
+    that are still valid in the table, so the table is written once for
+    the whole batch: one COPY of the new versions and one UPDATE of the
+    versions of the table that stopped being valid.
+    """
+
+    def __init__(self, df_path, config, connection):
+        # everything is committed by the batch, together with the list of loaded snapshots
+        super().__init__(df_path, config, connection=connection, defer_commit=True)
+        self.num_of_new_versions = 0
+        self.num_of_closed_versions = 0
+
+    def get_tbl_name(self):
+        return super().get_tbl_name() + '_history'
+
+    def set_column_with_their_types(self, column):
+        if column == 'serial_key':
+            return (column, 'character varying NOT NULL')
+        if column == 'valid_from':
+            return (column, 'date NOT NULL')
+        if column == 'valid_to':
+            return (column, 'date')
+        return (column, 'character varying')
+
+    # one version per serial key and date, and only one version of a serial key valid at a time
+    def add_keys_to_table(self, tbl_name=None):
+        tbl_name = tbl_name or self.tbl_name
+        self.cursor.execute(sql.SQL("ALTER TABLE {tbl_name} ADD PRIMARY KEY (serial_key, valid_from)").format(
+            tbl_name=sql.Identifier(tbl_name)))
+        self.cursor.execute(sql.SQL("CREATE UNIQUE INDEX {index_name} ON {tbl_name} (serial_key) "
+                                    "WHERE valid_to IS NULL").format(
+            index_name=sql.Identifier(tbl_name + '_valid'),
+            tbl_name=sql.Identifier(tbl_name)))
+
+    # the table has every column of every snapshot
+    def prepare_table(self, columns):
+        if not self.table_exists_in_db():
+            self.create_table_of_df(self.get_columns_with_their_types(pd.DataFrame(columns=columns)))
+            self.add_keys_to_table()
+            return
+        db_columns = self.get_columns_of_db_table()
+        self.add_new_columns_to_table([col for col in columns if get_db_column_name(col) not in db_columns])
+
+    # serial key -> hash of the versions of the table that are still valid
+    def get_valid_versions(self):
+        query = sql.SQL("SELECT serial_key, row_hash FROM {tbl_name} WHERE valid_to IS NULL").format(
+            tbl_name=sql.Identifier(self.tbl_name))
+        return {serial_key: {'row_hash': row_hash, 'in_db': True}
+                for _, rows in self.iter_row_batches_from_db(query) for serial_key, row_hash in rows}
+
+    # walk the snapshots in date order, returns the new versions and the valid_to of the table's versions
+    # that stopped being valid
+    def get_changes(self, snapshots):
+        valid_versions = self.get_valid_versions()
+        new_versions = []
+        closed_in_db = {}
+
+        def close(serial_key, snapshot_date):
+            version = valid_versions.pop(serial_key)
+            if version.get('in_db'):
+                closed_in_db[serial_key] = snapshot_date
+            else:
+                version['valid_to'] = snapshot_date
+
+        for snapshot_date, table_df in snapshots:
+            serial_keys_in_snapshot = set()
+            for row in table_df.to_dict('records'):
+                serial_key = row['serial_key']
+                serial_keys_in_snapshot.add(serial_key)
+                row_hash = get_version_hash(row)
+                version = valid_versions.get(serial_key)
+                if version is not None and version['row_hash'] == row_hash:
+                    continue
+                if version is not None:
+                    close(serial_key, snapshot_date)
+                version = {**row, 'valid_from': snapshot_date, 'valid_to': None, 'row_hash': row_hash}
+                new_versions.append(version)
+                valid_versions[serial_key] = version
+            # rows that are not in the sheet anymore
+            for serial_key in valid_versions.keys() - serial_keys_in_snapshot:
+                close(serial_key, snapshot_date)
+        return new_versions, closed_in_db
+
+    def close_versions_in_table(self, closed_in_db):
+        query = sql.SQL("UPDATE {tbl_name} AS t SET valid_to = v.valid_to FROM (VALUES %s) AS v (serial_key, valid_to) "
+                        "WHERE t.serial_key = v.serial_key AND t.valid_to IS NULL").format(
+            tbl_name=sql.Identifier(self.tbl_name))
+        execute_values(self.cursor, query.as_string(self.connection), list(closed_in_db.items()),
+                       template='(%s, %s::date)')
+
+    # apply the snapshots, [(snapshot date, final df), ...] in date order, to the history table
+    def load_snapshots(self, snapshots, columns):
+        try:
+            self.prepare_table(columns)
+            new_versions, closed_in_db = self.get_changes(snapshots)
+            if closed_in_db:
+                self.close_versions_in_table(closed_in_db)
+            if new_versions:
+                self.copy_data_of_df(pd.DataFrame(new_versions, columns=columns))
+            self.num_of_new_versions = len(new_versions)
+            self.num_of_closed_versions = len(closed_in_db) + sum(version['valid_to'] is not None
+                                                                  for version in new_versions)
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot load the snapshots into table {self.tbl_name}. Error:', error)
+            self.rollback()
+            traceback.print_exc()
+
+
+# runs inside a worker process: parse every vehicle line of one snapshot into its final df
+def parse_snapshot(path):
+    config = replace(load_config(), path_to_main_excel=path)
+    table_dfs = {}
+    errors = {}
+    with open_workbook_session(config) as session:
+        for vehicle in get_vehicle_lines(config):
+            try:
+                parser_obj = get_parser_obj(session, vehicle, config)
+                table_dfs[parser_obj.get_file_name()] = parser_obj.run()
+            except Exception as e:
+                errors[vehicle] = f'error in {vehicle}, error: {e}'
+            finally:
+                session.release(vehicle)
+    return table_dfs, errors
+
+
+# {snapshot date: path} of the snapshots in the directory, the files without a date in their name are left out
+def get_snapshots(snapshot_dir, pattern):
+    snapshots = {}
+    for path in sorted(glob.glob(os.path.join(snapshot_dir, pattern))):
+        snapshot_date = get_snapshot_date(path)
+        if snapshot_date is None:
+            print(f'{os.path.basename(path)}: no month.day.year date in the file name, left out')
+        elif snapshot_date in snapshots:
+            print(f'{os.path.basename(path)}: same date as {os.path.basename(snapshots[snapshot_date])}, left out')
+        else:
+            snapshots[snapshot_date] = path
+    return snapshots
+
+
+# parse the snapshots in a process pool, returns {csv name: [(snapshot date, final df), ...]} in date order
+# and the errors of the sheets that could not be parsed
+def parse_snapshots(snapshots, workers):
+    tables = {}
+    parse_errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(parse_snapshot, path): snapshot_date for snapshot_date, path in snapshots.items()}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            snapshot_date = futures[future]
+            table_dfs, errors = future.result()
+            parse_errors += [f'{os.path.basename(snapshots[snapshot_date])}: {error}' for error in errors.values()]
+            for csv_name, table_df in table_dfs.items():
+                tables.setdefault(csv_name, []).append((snapshot_date, table_df))
+    for table_snapshots in tables.values():
+        table_snapshots.sort(key=lambda snapshot: snapshot[0])
+    return tables, parse_errors
+
+
+# every column of every snapshot of a table, in the order they first appear
+def get_history_columns(table_snapshots):
+    columns = list(VERSION_COLUMNS)
+    for _, table_df in table_snapshots:
+        columns += [column for column in table_df.columns if column not in columns]
+    return columns
+
+
+# every history table in the database, also those of the vehicle lines no longer in the workbooks
+def drop_history_tables(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT tablename FROM pg_catalog.pg_tables "
+                   "WHERE schemaname = current_schema() AND tablename LIKE 'preorder\\_%\\_history'")
+    for (tbl_name,) in cursor.fetchall():
+        cursor.execute(sql.SQL("DROP TABLE {tbl_name}").format(tbl_name=sql.Identifier(tbl_name)))
+        print(f'Table {tbl_name} dropped successfully')
+    cursor.execute(f"DELETE FROM {SNAPSHOT_TABLE}")
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Load a directory of workbook snapshots into history tables')
+    arg_parser.add_argument('--dir', default=None,
+                            help='directory of the snapshots (default: the directory of the main excel file)')
+    arg_parser.add_argument('--pattern', default='*.xlsx', help='file name pattern of the snapshots')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of snapshots parsed at the same time')
+    arg_parser.add_argument('--rebuild', action='store_true',
+                            help='drop the history tables and load every snapshot again, needed to add a snapshot '
+                                 'older than the latest one loaded')
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    start_time = time.time()
+    config = load_config()
+    snapshot_dir = args.dir if args.dir is not None else os.path.dirname(config.path_to_main_excel) or '.'
+
+    connection = psycopg2.connect(**get_connection_params(config))
+    try:
+        create_snapshot_table(connection)
+        if args.rebuild:
+            drop_history_tables(connection)
+            loaded_snapshot_dates = set()
+        else:
+            loaded_snapshot_dates = get_loaded_snapshot_dates(connection)
+        snapshots = {snapshot_date: path for snapshot_date, path in get_snapshots(snapshot_dir, args.pattern).items()
+                     if snapshot_date not in loaded_snapshot_dates}
+        if loaded_snapshot_dates and snapshots and min(snapshots) < max(loaded_snapshot_dates):
+            raise SystemExit(f'{os.path.basename(snapshots[min(snapshots)])} is older than the latest snapshot loaded '
+                             f'({max(loaded_snapshot_dates)}), run with --rebuild to load the history again')
+        if not snapshots:
+            raise SystemExit('no new snapshots to load')
+        print(f'{len(snapshots)} new snapshots, {min(snapshots)} to {max(snapshots)}')
+
+        tables, parse_errors = parse_snapshots(snapshots, args.workers)
+        for error in parse_errors:
+            print(error)
+        # a snapshot is recorded as loaded for every table at once, a sheet missing from it would never be loaded
+        if parse_errors:
+            connection.rollback()
+            raise SystemExit(f'{len(parse_errors)} sheets could not be parsed, none of the snapshots were loaded')
+        failed = False
+        for csv_name in sorted(tables):
+            update_db_obj = UpdateHistoryDB(csv_name, config, connection)
+            update_db_obj.load_snapshots(tables[csv_name], get_history_columns(tables[csv_name]))
+            failed = failed or update_db_obj.failed
+            print(f'{update_db_obj.tbl_name}: {update_db_obj.num_of_new_versions} new versions, '
+                  f'{update_db_obj.num_of_closed_versions} closed')
+        if failed:
+            connection.rollback()
+            raise SystemExit('a table failed to load, none of the snapshots were loaded')
+        record_snapshots(connection.cursor(), sorted(snapshots.items()))
+        connection.commit()
+    finally:
+        connection.close()
+    print(f'{len(snapshots)} snapshots in {time.time() - start_time:.2f} seconds')
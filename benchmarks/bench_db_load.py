@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import load_config
+from updateDB import UpdateDB
+
+"""
+Rows/second of the two UpdateDB load paths, COPY and row by row INSERT,
+against the database in config.yaml. Creates and drops the table
+preorder_bench_load.
+
+    python benchmarks/bench_db_load.py --sizes 1000 100000 1000000
+"""
+
+
+def get_df(num_of_rows, num_of_columns=15):
+    serial_keys = np.char.add('bench_', np.arange(num_of_rows).astype(str)).astype(object)
+    df = pd.DataFrame({'serial_key': serial_keys})
+    for column in range(num_of_columns):
+        df[f'milestone_{column}'] = '03/16/2022'
+    return df
+
+
+def time_load(config, df, bulk_load):
+    update_db_obj = UpdateDB('bench_load.csv', config, bulk_load=bulk_load)
+    update_db_obj.delete_old_table()
+    update_db_obj.create_table_of_df(update_db_obj.get_columns_with_their_types(df))
+    update_db_obj.add_keys_to_table()
+    start_time = time.perf_counter()
+    update_db_obj.load_data_of_df(df)
+    return time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    arg_parser.add_argument('--config', default='./config.yaml')
+    args = arg_parser.parse_args()
+    config = load_config(args.config)
+
+    results = []
+    for num_of_rows in args.sizes:
+        df = get_df(num_of_rows)
+        for method, bulk_load in (('copy', True), ('insert', False)):
+            seconds = time_load(config, df, bulk_load)
+            results.append((num_of_rows, method, seconds))
+
+    update_db_obj = UpdateDB('bench_load.csv', config)
+    update_db_obj.delete_old_table()
+    update_db_obj.connection.commit()
+    update_db_obj.connection.close()
+
+    print(f'{"rows":>9} {"method":>7} {"seconds":>9} {"rows/s":>11}')
+    for num_of_rows, method, seconds in results:
+        print(f'{num_of_rows:>9} {method:>7} {seconds:>9.2f} {num_of_rows / seconds:>11.0f}')
@@ -0,0 +1,73 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parquet_files import write_parquet, read_parquet_as_text
+
+"""
+Size on disk and read time of the generated csvs against the same tables
+written as parquet files. The read is the one the loader does: the csv
+the way UpdateDB.get_df_from_csv reads it, the parquet file through
+read_parquet_as_text. The typed line reads the parquet files with their
+date and dictionary columns as they are. --scale repeats the rows of every table to see how
+both formats do on bigger tables. Needs pyarrow.
+
+    python benchmarks/bench_file_formats.py --csv-dir csvs_generated --scale 1 100
+"""
+
+
+# what UpdateDB.get_df_from_csv does
+def read_csv_for_db(csv):
+    return pd.read_csv(csv, dtype=str, keep_default_na=False)
+
+
+# the parquet file with its dates and dictionaries, for readers that do not need text
+def read_parquet_typed(path):
+    return pd.read_parquet(path)
+
+
+def time_reads(read, paths, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for path in paths:
+            read(path)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--csv-dir', default='csvs_generated')
+    arg_parser.add_argument('--scale', type=int, nargs='+', default=[1, 100])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    csvs = sorted(glob.glob(os.path.join(args.csv_dir, '*.csv')))
+    print(f'{len(csvs)} tables')
+    print(f'{"scale":>6} {"format":>8} {"KB":>9} {"read ms":>9}')
+    for scale in args.scale:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_files, parquet_files = [], []
+            for csv in csvs:
+                # the table as the parser gave it, every value a string and empty cells empty strings
+                final_df = pd.read_csv(csv, dtype=str, keep_default_na=False)
+                final_df = pd.concat([final_df] * scale, ignore_index=True)
+                name = os.path.splitext(os.path.basename(csv))[0]
+                csv_files.append(os.path.join(tmp_dir, name + '.csv'))
+                final_df.to_csv(csv_files[-1], index=False)
+                parquet_files.append(os.path.join(tmp_dir, name + '.parquet'))
+                write_parquet(final_df, parquet_files[-1])
+
+            for file_format, paths, read in (('csv', csv_files, read_csv_for_db),
+                                             ('parquet', parquet_files, read_parquet_as_text),
+                                             ('typed', parquet_files, read_parquet_typed)):
+                kilobytes = sum(os.path.getsize(path) for path in paths) / 1024
+                seconds = time_reads(read, paths, args.repeat)
+                print(f'{scale:>6} {file_format:>8} {kilobytes:>9.1f} {seconds * 1000:>9.1f}')
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import random
+import argparse
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import load_config
+from updateDB import get_connection_params
+from PreorderLookup import PreorderLookup
+
+"""
+Latency of PreorderLookup against the round trip to the database that the
+downstream scripts do today, one serial_key at a time. The point lookups
+ask for random serial keys, the filters for random vehicle line, model
+year and fuel type combinations taken from the tables, once with a cold
+cache and then again. --db also times the same point lookups against the
+preorder tables (loaded with updateDB.py from the same csvs).
+
+    python benchmarks/bench_lookup.py --csv-dir csvs_generated --lookups 10000 --db
+"""
+
+
+def time_calls(call, arguments):
+    start_time = time.perf_counter()
+    for argument in arguments:
+        call(*argument)
+    return (time.perf_counter() - start_time) / len(arguments)
+
+
+def print_line(name, seconds):
+    print(f'{name:>24} {seconds * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--csv-dir', default='csvs_generated')
+    arg_parser.add_argument('--lookups', type=int, default=10000)
+    arg_parser.add_argument('--db', action='store_true', help='also time the lookups against the database')
+    args = arg_parser.parse_args()
+    random.seed(0)
+
+    start_time = time.perf_counter()
+    lookup = PreorderLookup(args.csv_dir, cache_size=args.lookups)
+    info = lookup.cache_info()
+    print(f'{info["rows"]} rows of {info["tables"]} tables loaded and indexed in '
+          f'{time.perf_counter() - start_time:.3f} seconds')
+    if not info['rows']:
+        raise SystemExit(f'no csvs in {args.csv_dir}, run main.py first')
+
+    tables_of_serial_keys = [(tbl_name, row['serial_key'])
+                             for tbl_name, rows in lookup.rows_of_tables.items() for row in rows]
+    serial_keys = random.choices(tables_of_serial_keys, k=args.lookups)
+    index_keys = list(lookup.rows_by_index_key)
+    filters = [random.choice(index_keys) for _ in range(args.lookups)]
+    # the filters on a vehicle line, or a vehicle line and a model year, scan the keys of the index
+    partial_filters = [(vehicle_line, model_year if random.random() < 0.5 else None, None)
+                       for vehicle_line, model_year, _ in filters]
+
+    print(f'{"lookup":>24} {"us each":>10}')
+    print_line('get', time_calls(lookup.get, [(serial_key,) for _, serial_key in serial_keys]))
+    lookup.cache.clear()
+    print_line('find, cold cache', time_calls(lookup.find, filters))
+    print_line('find, warm cache', time_calls(lookup.find, filters))
+    lookup.cache.clear()
+    print_line('partial find, cold cache', time_calls(lookup.find, partial_filters))
+    print_line('partial find, warm cache', time_calls(lookup.find, partial_filters))
+
+    if args.db:
+        config = load_config()
+        connection = psycopg2.connect(**get_connection_params(config))
+        cursor = connection.cursor()
+
+        def get_from_db(tbl_name, serial_key):
+            cursor.execute(f'SELECT * FROM {tbl_name} WHERE serial_key = %s', (serial_key,))
+            return cursor.fetchone()
+
+        print_line('get, database', time_calls(get_from_db, serial_keys[:min(args.lookups, 2000)]))
+        connection.close()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Config import Config
+from Parser import Parser
+
+"""
+Micro-benchmark of Parser.parser() and the keyword removal of postprocess_dictionary.
+
+Every milestone row of a model year table becomes a column of the csv, so a
+table with thousands of milestone rows gives a table with thousands of columns.
+The time per row should stay flat as the tables grow.
+
+    python benchmarks/bench_parser_core.py
+"""
+
+config = Config(path_to_main_excel='',
+                no_fuel_types='', fuel_types='', sub_fuel_types='',
+                break_keywords=frozenset(['Down Weeks', 'Allocation Quarter']),
+                model_years=frozenset(['22MY', '23MY', '24MY']),
+                removal_keywords=frozenset(['Updates highlighted in orange', 'Past dates highlighted in gray',
+                                            'State and Local']),
+                database_details={})
+
+
+# stands in for WorkbookSession, serves rows built in memory
+class InMemorySession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_unhidden_rows(self, sheet_name):
+        return iter(self.rows)
+
+
+def get_rows(num_of_columns, num_of_values):
+    rows = [('Aviator',) + (None,) * (num_of_values + 1)]
+    for model_year in ('22MY', '23MY', '24MY'):
+        for column in range(num_of_columns):
+            first_value = model_year if column == 0 else None
+            rows.append((first_value, f'Milestone {column}') + ('TBD',) * num_of_values)
+        rows.append((None,) * (num_of_values + 2))
+    rows.append(('Down Weeks',) + (None,) * (num_of_values + 1))
+    return rows
+
+
+def time_parser(num_of_columns, num_of_values=3, repeat=3):
+    rows = get_rows(num_of_columns, num_of_values)
+    best = float('inf')
+    for _ in range(repeat):
+        parser_obj = Parser(InMemorySession(rows), 'Aviator', config)
+        start_time = time.perf_counter()
+        main_dict = parser_obj.parser()
+        extra_codes = parser_obj.get_extra_codes()
+        for subdict in main_dict.values():
+            for column in subdict.keys():
+                parser_obj.remove_extra_keywords_from_dict(subdict, column, extra_codes)
+        best = min(best, time.perf_counter() - start_time)
+    return best, len(rows)
+
+
+if __name__ == '__main__':
+    print(f'{"columns":>8} {"rows":>8} {"total ms":>10} {"us per row":>11}')
+    for num_of_columns in (10, 100, 1000, 5000):
+        seconds, num_of_rows = time_parser(num_of_columns)
+        print(f'{num_of_columns:>8} {num_of_rows:>8} {seconds * 1e3:>10.2f} {seconds / num_of_rows * 1e6:>11.2f}')
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Config import Config
+from FuelTypesParser import FuelTypesParser
+
+"""
+Peak memory and allocations of FuelTypesParser.parser() and
+postprocess_dictionary() on one large synthetic sheet, built in memory so
+the reader engine is left out. Every model year table has --columns
+milestone rows with a value per fuel type (dates, TBD or N/A), and a note
+next to its first milestone that the parser removes. Measured with
+tracemalloc:
+    held     the memory and the number of blocks the parsed sheet holds between the two steps
+    peak     the peak memory of each step, above what was allocated before it
+The time of each step is measured in a separate run, without tracemalloc.
+
+    python benchmarks/bench_parser_memory.py --columns 2000 --values 8 --model-years 6
+"""
+
+MODEL_YEARS = [f'{22 + i}MY' for i in range(20)]
+
+NOTES = ('Updates highlighted in orange', 'Past dates highlighted in gray', 'State and Local')
+
+
+def get_config(num_of_model_years):
+    return Config(path_to_main_excel='',
+                  no_fuel_types='', fuel_types='', sub_fuel_types='',
+                  break_keywords=frozenset(['Down Weeks', 'Allocation Quarter']),
+                  model_years=frozenset(MODEL_YEARS[:num_of_model_years]),
+                  removal_keywords=frozenset(NOTES),
+                  database_details={})
+
+
+# stands in for WorkbookSession, serves rows built in memory
+class InMemorySession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_unhidden_rows(self, sheet_name):
+        return iter(self.rows)
+
+
+def get_value(rng):
+    roll = rng.random()
+    if roll < 0.7:
+        # a date cell, openpyxl gives a new datetime for every cell
+        return datetime(2023, 1, 1) + timedelta(days=rng.randrange(700))
+    return rng.choice(('TBD', 'N/A', 'No Scheduling'))
+
+
+def get_rows(num_of_model_years, num_of_columns, num_of_values, seed=0):
+    rng = random.Random(seed)
+    rows = [('Synthetic', None) + tuple(f'Fuel {i}' for i in range(num_of_values))]
+    for model_year in MODEL_YEARS[:num_of_model_years]:
+        for column in range(num_of_columns):
+            first_value, note = (model_year, (rng.choice(NOTES),)) if column == 0 else (None, ())
+            rows.append((first_value, f'Milestone {column}')
+                        + tuple(get_value(rng) for _ in range(num_of_values)) + note)
+        rows.append((None,) * (num_of_values + 2))
+    rows.append(('Down Weeks',) + (None,) * (num_of_values + 1))
+    return rows
+
+
+def measure_memory(rows, config):
+    parser_obj = FuelTypesParser(InMemorySession(rows), 'Synthetic', config)
+    tracemalloc.start()
+    before_parse = tracemalloc.take_snapshot()
+    main_dict = parser_obj.parser()
+    parse_peak = tracemalloc.get_traced_memory()[1]
+    after_parse = tracemalloc.take_snapshot()
+    held = after_parse.compare_to(before_parse, 'filename')
+    held_bytes = sum(stat.size_diff for stat in held)
+    held_blocks = sum(stat.count_diff for stat in held)
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    final_df = parser_obj.postprocess_dictionary(main_dict)
+    postprocess_peak = tracemalloc.get_traced_memory()[1] - memory_before
+    tracemalloc.stop()
+    return final_df.shape, held_bytes, held_blocks, parse_peak, postprocess_peak
+
+
+def measure_time(rows, config, repeat):
+    parse_seconds, postprocess_seconds = float('inf'), float('inf')
+    for _ in range(repeat):
+        parser_obj = FuelTypesParser(InMemorySession(rows), 'Synthetic', config)
+        start_time = time.perf_counter()
+        main_dict = parser_obj.parser()
+        parsed_at = time.perf_counter()
+        parser_obj.postprocess_dictionary(main_dict)
+        parse_seconds = min(parse_seconds, parsed_at - start_time)
+        postprocess_seconds = min(postprocess_seconds, time.perf_counter() - parsed_at)
+    return parse_seconds, postprocess_seconds
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--model-years', type=int, default=6)
+    arg_parser.add_argument('--columns', type=int, default=2000, help='milestone rows per model year table')
+    arg_parser.add_argument('--values', type=int, default=8, help='values per milestone row (fuel types)')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    config = get_config(args.model_years)
+    rows = get_rows(args.model_years, args.columns, args.values)
+    shape, held_bytes, held_blocks, parse_peak, postprocess_peak = measure_memory(rows, config)
+    parse_seconds, postprocess_seconds = measure_time(rows, config, args.repeat)
+    print(f'final df {shape[0]} rows x {shape[1]} columns, {len(rows)} rows in the sheet')
+    print(f'{"step":>12} {"ms":>9} {"peak MB":>9} {"held MB":>9} {"held blocks":>12}')
+    print(f'{"parser":>12} {parse_seconds * 1e3:>9.1f} {parse_peak / 2 ** 20:>9.2f} {held_bytes / 2 ** 20:>9.2f} '
+          f'{held_blocks:>12}')
+    print(f'{"postprocess":>12} {postprocess_seconds * 1e3:>9.1f} {postprocess_peak / 2 ** 20:>9.2f}')
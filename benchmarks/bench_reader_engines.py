@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import load_config, open_workbook_session
+from main import get_vehicle_lines, get_parser_obj
+
+"""
+Wall time and peak RSS of parsing every vehicle line with each reader engine,
+openpyxl loading the whole workbook and xml streaming the sheets out of the
+xlsx zip. Every engine runs in a fresh process so the peak RSS is its own.
+No csvs are written.
+
+    python benchmarks/bench_reader_engines.py --engines openpyxl xml
+"""
+
+
+# runs in its own process: parse every vehicle line and report the time and the peak RSS in MB
+def parse_with_engine(config, engine):
+    config = replace(config, reader_engine=engine)
+    start_time = time.perf_counter()
+    num_of_rows = 0
+    with open_workbook_session(config) as session:
+        for vehicle in get_vehicle_lines(config):
+            num_of_rows += len(get_parser_obj(session, vehicle, config).run())
+            session.release(vehicle)
+    seconds = time.perf_counter() - start_time
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, num_of_rows
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engines', nargs='+', default=['openpyxl', 'xml'])
+    arg_parser.add_argument('--config', default='./config.yaml')
+    arg_parser.add_argument('--path', help='excel file to read instead of the one in the config')
+    args = arg_parser.parse_args()
+    config = load_config(args.config)
+    if args.path:
+        config = replace(config, path_to_main_excel=args.path)
+
+    context = multiprocessing.get_context('spawn')
+    print(f'{"engine":>9} {"seconds":>9} {"peak MB":>9} {"rows":>7}')
+    for engine in args.engines:
+        with context.Pool(1) as pool:
+            seconds, peak_mb, num_of_rows = pool.apply(parse_with_engine, (config, engine))
+        print(f'{engine:>9} {seconds:>9.2f} {peak_mb:>9.0f} {num_of_rows:>7}')
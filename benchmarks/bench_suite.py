@@ -0,0 +1,169 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from dataclasses import replace
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+from utilities import load_config, open_workbook_session
+from main import get_parser_obj
+from Parser import get_name_to_save
+from updateDB import UpdateDB, get_connection_params
+from generate_workbook import generate_workbook, get_sheet_names
+
+"""
+Times every stage of the parsers on a synthetic workbook (see generate_workbook.py),
+separately for Parser, FuelTypesParser and SubFuelTypesParser:
+    open         opening the workbook with the reader engine, once for all the sheets
+    header       the parser constructor, which reads the header rows
+    parse        Parser.parser(), reading the rows of the sheet and building the dictionary
+    postprocess  postprocess_dictionary(), building the final df
+    save         writing the csv
+    load         loading the final df with UpdateDB, only with --db
+Every stage is the best of --repeat runs, summed over the sheets of a parser.
+The results are saved as JSON, together with the commit and the workbook size, and
+--compare prints the change against the results of an earlier commit.
+
+    python benchmarks/bench_suite.py --sheets 30 --rows 50 --output bench_results.json
+    python benchmarks/bench_suite.py --sheets 30 --rows 50 --compare bench_results.json
+"""
+
+STAGES = ('open', 'header', 'parse', 'postprocess', 'save', 'load')
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# parse every sheet once, returns {(parser class, stage): seconds}
+def time_stages_once(config, sheet_names, dir_to_save, connection):
+    seconds = {}
+
+    def add(parser_name, stage, stage_seconds):
+        seconds[(parser_name, stage)] = seconds.get((parser_name, stage), 0) + stage_seconds
+
+    start_time = time.perf_counter()
+    session = open_workbook_session(config)
+    add('workbook', 'open', time.perf_counter() - start_time)
+    with session:
+        for vehicle in sheet_names:
+            start_time = time.perf_counter()
+            parser_obj = get_parser_obj(session, vehicle, config)
+            parser_name = type(parser_obj).__name__
+            add(parser_name, 'header', time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            main_dict = parser_obj.parser()
+            add(parser_name, 'parse', time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            final_df = parser_obj.postprocess_dictionary(main_dict)
+            add(parser_name, 'postprocess', time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            parser_obj.save_final_df(final_df, dir_to_save)
+            add(parser_name, 'save', time.perf_counter() - start_time)
+
+            if connection is not None:
+                start_time = time.perf_counter()
+                # UpdateDB reports every step, keep the benchmark output readable
+                with redirect_stdout(io.StringIO()):
+                    UpdateDB(parser_obj.get_file_name(), config, connection=connection,
+                             table_df=final_df).do_db_operation()
+                add(parser_name, 'load', time.perf_counter() - start_time)
+    return seconds
+
+
+def time_stages(config, sheet_names, repeat, connection):
+    best = {}
+    with tempfile.TemporaryDirectory() as dir_to_save:
+        for _ in range(repeat):
+            for key, seconds in time_stages_once(config, sheet_names, dir_to_save + '/', connection).items():
+                best[key] = min(best.get(key, float('inf')), seconds)
+    return best
+
+
+def drop_tables(connection, sheet_names):
+    cursor = connection.cursor()
+    for sheet_name in sheet_names:
+        cursor.execute(f'DROP TABLE IF EXISTS preorder_{get_name_to_save(sheet_name)}')
+    connection.commit()
+
+
+def print_results(stages, baseline=None):
+    baseline_seconds = {}
+    if baseline is not None:
+        baseline_seconds = {(stage['parser'], stage['stage']): stage['seconds'] for stage in baseline['stages']}
+        print(f'against {baseline["commit"]} from {baseline["created_at"]}')
+    print(f'{"parser":>20} {"stage":>12} {"ms":>10} {"before ms":>10} {"change":>8}')
+    for stage in stages:
+        line = f'{stage["parser"]:>20} {stage["stage"]:>12} {stage["seconds"] * 1000:>10.2f}'
+        before = baseline_seconds.get((stage['parser'], stage['stage']))
+        if before:
+            line += f' {before * 1000:>10.2f} {(stage["seconds"] / before - 1) * 100:>+7.1f}%'
+        print(line)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Time every stage of the parsers on a synthetic workbook')
+    arg_parser.add_argument('--sheets', type=int, default=21)
+    arg_parser.add_argument('--model-years', type=int, default=3)
+    arg_parser.add_argument('--columns', type=int, default=3)
+    arg_parser.add_argument('--rows', type=int, default=20)
+    arg_parser.add_argument('--engine', default='openpyxl', help='reader engine to open the workbook with')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--db', action='store_true',
+                            help='also time loading the tables into the database in config.yaml, '
+                                 'the tables are dropped at the end')
+    arg_parser.add_argument('--config', default='./config.yaml')
+    arg_parser.add_argument('--output', default='bench_results.json')
+    arg_parser.add_argument('--compare', help='results of an earlier run to compare against')
+    args = arg_parser.parse_args()
+
+    sheet_names = get_sheet_names(args.sheets)
+    workbook = {'sheets': args.sheets, 'model_years': args.model_years, 'columns': args.columns, 'rows': args.rows}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = generate_workbook(os.path.join(tmp_dir, 'synthetic_fdnb.xlsx'), args.sheets, args.model_years,
+                                   args.columns, args.rows)
+        config = replace(config, reader_engine=args.engine)
+        connection = None
+        if args.db:
+            config = replace(config, database_details=load_config(args.config).database_details)
+            connection = psycopg2.connect(**get_connection_params(config))
+        try:
+            best = time_stages(config, sheet_names, args.repeat, connection)
+        finally:
+            if connection is not None:
+                drop_tables(connection, sheet_names)
+                connection.close()
+
+    stages = [{'parser': parser_name, 'stage': stage, 'seconds': seconds}
+              for (parser_name, stage), seconds in sorted(best.items(), key=lambda item: (item[0][0],
+                                                                                           STAGES.index(item[0][1])))]
+    results = {'commit': get_commit(), 'created_at': datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'engine': args.engine, 'repeat': args.repeat,
+               'workbook': workbook, 'stages': stages}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['workbook'] != workbook or baseline['engine'] != args.engine:
+            print(f'warning: {args.compare} was run on {baseline["workbook"]} with {baseline["engine"]}')
+    print_results(stages, baseline)
+    with open(args.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f'results saved to {args.output}')
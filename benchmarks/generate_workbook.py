@@ -0,0 +1,164 @@
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+import yaml
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Config import Config
+
+"""
+Writes a synthetic FDNB workbook with the structure the parsers expect, for
+benchmarking without the real file:
+    1. The vehicle line name in the first row, followed by its fuel types on fuel type sheets.
+       Sub-fuel type sheets have a plant as their only fuel type and the sub-fuel types in the second row.
+    2. One block per model year, starting with the model year ('22MY' etc.) next to its first milestone,
+       one milestone per row with a value per fuel type (dates, TBD or N/A), blocks separated by blank rows.
+       Sheets without fuel types have a single value per milestone.
+       The first blocks are hidden, like the past model years in the real sheets.
+    3. The notes of the real sheets next to the first milestones, which the parser removes.
+    4. A "Down Weeks" table that ends the model year tables.
+The sheets cycle through the three vehicle line types. Next to the workbook a config.yaml is written
+with the vehicle lines, model years and keywords that match it.
+
+    python benchmarks/generate_workbook.py --sheets 30 --model-years 3 --columns 4 --rows 12 --output synthetic.xlsx
+"""
+
+SHEET_TYPES = ('no fuel types', 'fuel types', 'sub-fuel types')
+
+NOTES = ('Updates highlighted in orange', 'Past dates highlighted in gray', 'State and Local')
+
+BREAK_KEYWORDS = ('Down Weeks', 'Allocation Quarter')
+
+DATE_FORMATS = ('mm/dd/yyyy', 'm/d;@')
+
+
+def get_model_years(num_of_model_years):
+    return [f'{22 + i}MY' for i in range(num_of_model_years)]
+
+
+# fixed width names, so the sheets sort in the order they are written
+def get_sheet_names(num_of_sheets):
+    return [f'Line {i:04d}' for i in range(1, num_of_sheets + 1)]
+
+
+def get_sheet_types(sheet_names):
+    return {sheet_name: SHEET_TYPES[i % len(SHEET_TYPES)] for i, sheet_name in enumerate(sheet_names)}
+
+
+# the config the parsers need for a synthetic workbook
+def get_config(path, num_of_sheets, num_of_model_years, num_of_hidden_model_years=1, database_details=None):
+    sheet_types = get_sheet_types(get_sheet_names(num_of_sheets))
+    vehicle_lines = {sheet_type: ', '.join(name for name, type_ in sheet_types.items() if type_ == sheet_type)
+                     for sheet_type in SHEET_TYPES}
+    return Config(path_to_main_excel=path,
+                  no_fuel_types=vehicle_lines['no fuel types'],
+                  fuel_types=vehicle_lines['fuel types'],
+                  sub_fuel_types=vehicle_lines['sub-fuel types'],
+                  break_keywords=frozenset(BREAK_KEYWORDS),
+                  model_years=frozenset(get_model_years(num_of_hidden_model_years + num_of_model_years)),
+                  removal_keywords=frozenset(NOTES),
+                  database_details=database_details or {})
+
+
+def write_config(config, config_path):
+    cfg = {'paths': {'path to main csv': config.path_to_main_excel},
+           'vehicle line types': {'no fuel types': config.no_fuel_types,
+                                  'fuel types': config.fuel_types,
+                                  'sub-fuel types': config.sub_fuel_types},
+           'values to compare': ', '.join(sorted(config.break_keywords)),
+           'model years': ', '.join(sorted(config.model_years)),
+           'values to remove': ', '.join(sorted(config.removal_keywords)),
+           'database_details': config.database_details}
+    with open(config_path, 'w') as yml_file:
+        yaml.safe_dump(cfg, yml_file, sort_keys=False, width=1000)
+
+
+# a milestone value: mostly dates, sometimes not decided yet
+def get_milestone_value(rng):
+    draw = rng.random()
+    if draw < 0.15:
+        return 'TBD'
+    if draw < 0.2:
+        return 'N/A'
+    return datetime(2022, 1, 1) + timedelta(days=rng.randrange(730))
+
+
+# the first rows of the sheet, the ones the parsers read the fuel types from
+def get_header_rows(sheet_name, sheet_type, num_of_columns):
+    if sheet_type == 'fuel types':
+        return [[sheet_name, None] + [f'Fuel {i}' for i in range(1, num_of_columns + 1)]]
+    if sheet_type == 'sub-fuel types':
+        return [[sheet_name, None, 'Plant'],
+                [None, None] + [f'Sub Fuel {i}' for i in range(1, num_of_columns + 1)]]
+    return [[sheet_name]]
+
+
+def append_row(ws, row_values, hidden=False, date_format=None):
+    ws.append(row_values)
+    row_number = ws.max_row
+    if hidden:
+        ws.row_dimensions[row_number].hidden = True
+    if date_format is not None:
+        for cell in ws[row_number]:
+            if isinstance(cell.value, datetime):
+                cell.number_format = date_format
+
+
+def write_sheet(ws, sheet_name, sheet_type, model_years, num_of_hidden_model_years, num_of_columns, num_of_rows, rng):
+    # the model year tables of a vehicle line without fuel types have a single value per milestone
+    if sheet_type == 'no fuel types':
+        num_of_columns = 1
+    for row_values in get_header_rows(sheet_name, sheet_type, num_of_columns):
+        append_row(ws, row_values)
+
+    for i, model_year in enumerate(model_years):
+        hidden = i < num_of_hidden_model_years
+        for row in range(num_of_rows):
+            row_values = [model_year if row == 0 else None, f'Milestone {row + 1}']
+            row_values += [get_milestone_value(rng) for _ in range(num_of_columns)]
+            if row < len(NOTES):
+                row_values += [None, NOTES[row]]
+            append_row(ws, row_values, hidden, rng.choice(DATE_FORMATS))
+        append_row(ws, [], hidden)
+
+    append_row(ws, ['Down Weeks'])
+    for week in range(1, 4):
+        append_row(ws, [None, f'Week {week}', get_milestone_value(rng)], date_format=DATE_FORMATS[0])
+
+
+def generate_workbook(path, num_of_sheets=20, num_of_model_years=3, num_of_columns=3, num_of_rows=10,
+                      num_of_hidden_model_years=1, seed=0):
+    rng = random.Random(seed)
+    model_years = get_model_years(num_of_hidden_model_years + num_of_model_years)
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name, sheet_type in get_sheet_types(get_sheet_names(num_of_sheets)).items():
+        write_sheet(wb.create_sheet(sheet_name), sheet_name, sheet_type, model_years, num_of_hidden_model_years,
+                    num_of_columns, num_of_rows, rng)
+    wb.save(path)
+    return get_config(path, num_of_sheets, num_of_model_years, num_of_hidden_model_years)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Write a synthetic FDNB workbook and a config.yaml for it')
+    arg_parser.add_argument('--sheets', type=int, default=20, help='number of vehicle line sheets')
+    arg_parser.add_argument('--model-years', type=int, default=3, help='number of visible model year tables per sheet')
+    arg_parser.add_argument('--hidden-model-years', type=int, default=1,
+                            help='number of hidden model year tables above the visible ones')
+    arg_parser.add_argument('--columns', type=int, default=3,
+                            help='values per milestone row, the number of fuel types (or sub-fuel types), '
+                                 'the sheets without fuel types always have one')
+    arg_parser.add_argument('--rows', type=int, default=10, help='milestone rows per model year table')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', default='synthetic_fdnb.xlsx')
+    arg_parser.add_argument('--config-output', default='synthetic_config.yaml')
+    args = arg_parser.parse_args()
+
+    config = generate_workbook(args.output, args.sheets, args.model_years, args.columns, args.rows,
+                               args.hidden_model_years, args.seed)
+    write_config(config, args.config_output)
+    print(f'wrote {args.output} and {args.config_output}')
@@ -0,0 +1,217 @@
+import glob
+import json
+import time
+import argparse
+import traceback
+import pandas as pd
+import psycopg2
+import psycopg2.sql as sql
+from utilities import load_config
+from main import get_vehicle_lines
+from Parser import get_name_to_save
+from updateDB import (UpdateDB, get_connection_params, get_columns_of_tables, get_db_column_name,
+                      get_date_columns_of_table, get_text_columns_sql)
+from typed_dates import get_dates_and_notes
+
+"""
+Consolidated layout: the rows of every vehicle line in a single table, preorder_milestones, instead of
+a preorder_<vehicle line> table each:
+    1. serial_key is the primary key, the serial keys start with the vehicle line so they do not collide.
+    2. vehicle_line, model_year, fuel_type and sub_fuel_type are indexed columns, NULL where the sheet
+       does not have them.
+    3. The milestone columns of the sheet go to one JSONB object per row, milestones, without the empty ones.
+       The dates are written YYYY-MM-DD, so they compare and sort as text, the rest of the text as it is.
+    4. source_table is the preorder_<vehicle line> table the row belongs to, the rows of a vehicle line
+       are replaced together.
+    5. All the vehicle lines are committed together, or not at all.
+Load the csvs (or parquet files) in csvs_generated/ with `python consolidated.py`, or copy the
+preorder_<vehicle line> tables already in the database with `python consolidated.py --migrate`.
+The job 1 dates of the 24MY vehicle lines, and the rows with a job 1 date in June 2024:
+    SELECT vehicle_line, fuel_type, milestones->>'job_1_date' FROM preorder_milestones WHERE model_year = '24MY'
+    SELECT * FROM preorder_milestones WHERE milestones->>'job_1_date' BETWEEN '2024-06-01' AND '2024-06-30'
+A milestone that is filtered on by date often can get a B-tree index on the same expression:
+    CREATE INDEX ON preorder_milestones ((milestones->>'job_1_date'))
+"""
+
+CONSOLIDATED_TABLE = 'preorder_milestones'
+
+# the text of a date as the parser writes it (DATE_FORMAT), for the migration done by the server
+DATE_PATTERN = '^[0-9]{2}/[0-9]{2}/[0-9]{4}$'
+
+# the columns that can be on any sheet, the rest of the columns of a sheet are its milestones
+KEY_COLUMNS = ['vehicle_line', 'model_year', 'fuel_type', 'sub_fuel_type']
+
+
+def create_consolidated_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {CONSOLIDATED_TABLE} ("
+                   "serial_key character varying PRIMARY KEY, "
+                   "source_table character varying NOT NULL, "
+                   "vehicle_line character varying, "
+                   "model_year character varying, "
+                   "fuel_type character varying, "
+                   "sub_fuel_type character varying, "
+                   "milestones jsonb NOT NULL DEFAULT '{}')")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CONSOLIDATED_TABLE}_source_table "
+                   f"ON {CONSOLIDATED_TABLE} (source_table)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CONSOLIDATED_TABLE}_vehicle_line "
+                   f"ON {CONSOLIDATED_TABLE} (vehicle_line, model_year)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CONSOLIDATED_TABLE}_model_year "
+                   f"ON {CONSOLIDATED_TABLE} (model_year)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CONSOLIDATED_TABLE}_fuel_type "
+                   f"ON {CONSOLIDATED_TABLE} (fuel_type, sub_fuel_type)")
+    # key and containment tests on the milestones, e.g. milestones @> '{"job_1_date": "TBD"}'
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {CONSOLIDATED_TABLE}_milestones "
+                   f"ON {CONSOLIDATED_TABLE} USING gin (milestones)")
+    connection.commit()
+
+
+# the values are the text of the parsed tables, or NULL for the columns a table does not have
+def is_empty_value(value):
+    return value is None or value == ''
+
+
+# the values of a milestone column with its dates as YYYY-MM-DD
+def get_milestone_values(column_values):
+    dates_and_notes = get_dates_and_notes(column_values)
+    if dates_and_notes is None:
+        return column_values
+    dates, notes = dates_and_notes
+    return [note if pd.isna(date) else date.isoformat() for date, note in zip(dates, notes)]
+
+
+class UpdateConsolidatedDB(UpdateDB):
+    """
+    Replaces the rows of one vehicle line in the consolidated table with
+    the rows of its csv. Nothing is committed, the caller commits all the
+    vehicle lines together.
+    """
+
+    def __init__(self, df_path, config, connection, report=None):
+        super().__init__(df_path, config, connection=connection, defer_commit=True, report=report)
+        # the table of the vehicle line in the one table per vehicle line layout
+        self.source_table = UpdateDB.get_tbl_name(self)
+
+    def get_tbl_name(self):
+        return CONSOLIDATED_TABLE
+
+    # the key columns of the df and its milestones as a JSON object per row, the milestones are named
+    # like the columns of the preorder_<vehicle line> tables
+    def get_consolidated_df(self, table_df):
+        milestone_columns = [col for col in table_df.columns if col not in KEY_COLUMNS and col != 'serial_key']
+        milestone_names = [get_db_column_name(col) for col in milestone_columns]
+        consolidated_df = pd.DataFrame({'serial_key': table_df['serial_key'].values,
+                                        'source_table': self.source_table})
+        for column in KEY_COLUMNS:
+            consolidated_df[column] = table_df[column].values if column in table_df.columns else None
+        milestone_values = [get_milestone_values(table_df[col]) for col in milestone_columns]
+        consolidated_df['milestones'] = [
+            json.dumps({name: value for name, value in zip(milestone_names, row) if not is_empty_value(value)})
+            for row in zip(*milestone_values)] if milestone_columns else '{}'
+        return consolidated_df
+
+    def delete_rows_of_vehicle_line(self):
+        try:
+            self.cursor.execute(sql.SQL("DELETE FROM {tbl_name} WHERE source_table = %s").format(
+                tbl_name=sql.Identifier(self.tbl_name)), (self.source_table,))
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot delete the rows of {self.source_table} from {self.tbl_name}', error)
+            self.rollback()
+            traceback.print_exc()
+
+    def do_db_operation(self):
+        df = self.read_df()
+        with self.report.stage(self.report_name, 'replace') as record:
+            self.delete_rows_of_vehicle_line()
+            if not self.failed:
+                self.copy_data_of_df(self.get_consolidated_df(df))
+            self.report.set_shape(record, df)
+
+    # copy the rows of the vehicle line's table into the consolidated table, without them leaving the server,
+    # the dates written YYYY-MM-DD like get_consolidated_df does. The date columns of a table loaded with
+    # --typed-dates are merged back with their note columns, so the milestones are the same either way
+    def migrate_vehicle_line_table(self, source_columns):
+        date_columns = get_date_columns_of_table(self.cursor, self.source_table)
+        key_columns = [sql.Identifier(col) if col in source_columns else sql.SQL('NULL') for col in KEY_COLUMNS]
+        query = sql.SQL("INSERT INTO {tbl_name} (serial_key, source_table, {key_columns}, milestones) "
+                        "SELECT serial_key, %s, {source_key_columns}, "
+                        "COALESCE((SELECT jsonb_object_agg(key, CASE WHEN value #>> '{{}}' ~ %s "
+                        "THEN to_jsonb(to_char(to_date(value #>> '{{}}', 'MM/DD/YYYY'), 'YYYY-MM-DD')) ELSE value END) "
+                        "FROM jsonb_each(to_jsonb(t) - %s::text[]) "
+                        "WHERE value NOT IN ('null'::jsonb, '\"\"'::jsonb)), '{{}}') "
+                        "FROM (SELECT {text_columns} FROM {source_table}) AS t").format(
+            tbl_name=sql.Identifier(self.tbl_name),
+            key_columns=sql.SQL(', ').join(sql.Identifier(col) for col in KEY_COLUMNS),
+            source_key_columns=sql.SQL(', ').join(key_columns),
+            text_columns=get_text_columns_sql(source_columns, date_columns, 'YYYY-MM-DD'),
+            source_table=sql.Identifier(self.source_table))
+        self.delete_rows_of_vehicle_line()
+        if self.failed:
+            return 0
+        try:
+            self.cursor.execute(query, (self.source_table, DATE_PATTERN, ['serial_key'] + KEY_COLUMNS))
+            return self.cursor.rowcount
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot migrate table {self.source_table}', error)
+            self.rollback()
+            traceback.print_exc()
+            return 0
+
+
+# load the csvs of every vehicle line, returns whether they all loaded
+def load_vehicle_lines(connection, config, csvs):
+    for csv in csvs:
+        update_db_obj = UpdateConsolidatedDB(csv, config, connection)
+        update_db_obj.do_db_operation()
+        if update_db_obj.failed:
+            return False
+    return True
+
+
+# copy the preorder_<vehicle line> tables that are in the database, returns whether they all migrated
+def migrate_vehicle_lines(connection, config):
+    csvs = [get_name_to_save(vehicle) + '.csv' for vehicle in get_vehicle_lines(config)]
+    update_db_objs = [UpdateConsolidatedDB(csv, config, connection) for csv in csvs]
+    columns_of_tables = get_columns_of_tables(connection.cursor(),
+                                              [update_db_obj.source_table for update_db_obj in update_db_objs])
+    for update_db_obj in update_db_objs:
+        if update_db_obj.source_table not in columns_of_tables:
+            print(f'{update_db_obj.source_table}: not in the database, left out')
+            continue
+        num_of_rows = update_db_obj.migrate_vehicle_line_table(columns_of_tables[update_db_obj.source_table])
+        if update_db_obj.failed:
+            return False
+        print(f'{update_db_obj.source_table}: {num_of_rows} rows migrated')
+    return True
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Load every vehicle line into a single table, '
+                                                     + CONSOLIDATED_TABLE)
+    arg_parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                            help='load the csvs, or the parquet files written by main.py --format parquet')
+    arg_parser.add_argument('--migrate', action='store_true',
+                            help='copy the preorder_<vehicle line> tables in the database instead of loading files')
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    start_time = time.time()
+    config = load_config()
+
+    connection = psycopg2.connect(**get_connection_params(config))
+    try:
+        create_consolidated_table(connection)
+        if args.migrate:
+            loaded = migrate_vehicle_lines(connection, config)
+        else:
+            loaded = load_vehicle_lines(connection, config,
+                                        sorted(glob.glob('./csvs_generated/*.' + args.format)))
+        if not loaded:
+            connection.rollback()
+            raise SystemExit(f'a vehicle line failed to load, {CONSOLIDATED_TABLE} was left as it was')
+        connection.commit()
+    finally:
+        connection.close()
+    print(f'{CONSOLIDATED_TABLE} loaded in {time.time() - start_time:.2f} seconds')
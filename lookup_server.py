@@ -0,0 +1,94 @@
+import json
+import argparse
+import psycopg2
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from utilities import load_config
+from updateDB import get_connection_params
+from PreorderLookup import PreorderLookup, INDEX_COLUMNS
+
+"""
+Local HTTP endpoint over PreorderLookup, for the tools that cannot import it. The rows are served from
+memory as JSON, the files (or with --db the tables) are checked for a new version at most once every
+--check-interval seconds:
+    GET /rows/<serial_key>                                  the row, 404 if there is none
+    GET /rows?vehicle_line=F-150&model_year=24MY&fuel_type=Gas   the matching rows, every filter is optional
+    GET /stats                                              the cache hits and misses, tables and rows
+
+    python lookup_server.py --port 8050
+    python lookup_server.py --db            the tables as updateDB.py, pipeline.py or watch.py loaded them
+"""
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    # keep-alive, so a client doing one lookup after the other does not open a connection for each
+    protocol_version = 'HTTP/1.1'
+    lookup = None
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith('/rows/'):
+            row = self.lookup.get(unquote(url.path[len('/rows/'):]))
+            if row is None:
+                self.send_json(404, {'error': 'no row with this serial_key'})
+            else:
+                self.send_json(200, row)
+        elif url.path == '/rows':
+            query = parse_qs(url.query)
+            unknown_filters = set(query) - set(INDEX_COLUMNS)
+            if unknown_filters:
+                self.send_json(400, {'error': f'cannot filter on {", ".join(sorted(unknown_filters))}, '
+                                              f'the filters are {", ".join(INDEX_COLUMNS)}'})
+                return
+            self.send_json(200, list(self.lookup.find(**{column: values[-1] for column, values in query.items()})))
+        elif url.path == '/stats':
+            self.send_json(200, self.lookup.cache_info())
+        else:
+            self.send_json(404, {'error': 'unknown path'})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Serve lookups of the parsed tables over HTTP')
+    arg_parser.add_argument('--host', default='127.0.0.1', help='only local clients by default')
+    arg_parser.add_argument('--port', type=int, default=8050)
+    arg_parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                            help='serve the csvs, or the parquet files written by main.py --format parquet')
+    arg_parser.add_argument('--db', action='store_true',
+                            help='serve the tables in the database, read again when they are loaded, instead of the '
+                                 'files main.py writes')
+    arg_parser.add_argument('--cache-size', type=int, default=4096, help='filter results kept in the LRU cache')
+    arg_parser.add_argument('--check-interval', type=float, default=1,
+                            help='seconds between two checks of the files (or tables) for a new version')
+    arg_parser.add_argument('--verbose', action='store_true', help='log every request')
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    connection = psycopg2.connect(**get_connection_params(load_config())) if args.db else None
+    LookupHandler.lookup = PreorderLookup('./csvs_generated', args.format, args.cache_size, args.check_interval,
+                                          connection)
+    server = ThreadingHTTPServer((args.host, args.port), LookupHandler)
+    server.verbose = args.verbose
+    info = LookupHandler.lookup.cache_info()
+    print(f'serving {info["rows"]} rows of {info["tables"]} tables on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('stopped serving')
+    finally:
+        server.server_close()
+        if connection is not None:
+            connection.close()
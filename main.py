@@ -1,58 +1,175 @@
 import os
+import argparse
 import traceback
 import pandas as pd
+from collections import namedtuple
 from tqdm import tqdm
-from openpyxl import load_workbook
-from utilities import get_path_to_df, get_vehicles_and_their_types
-from Parser import Parser
-from FuelTypesParser import FuelTypesParser
-from SubFuelTypesParser import SubFuelTypesParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utilities import load_config, open_workbook_session
+from XlsxStreamSession import XlsxStreamSession
+from parser_registry import get_parser_obj, has_model_year_table
+from FingerprintCache import FingerprintCache, get_sheet_fingerprint
+from RunReport import RunReport
 
 """
 Preprocessing that needs to be done manually for this script to work:
     1. Check for merged cells in vehicle lines sheet and unmerge them.
     2. Add an empty row between model year tables.
     3. Remove repetitive model year from the model year's table (see Explorer)
-    4. Add fuel types for every vehicle line in the config file.
+    4. Add fuel types for every vehicle line in the config file, a vehicle line that is not
+       in the config has its type detected from its first rows (see parser_registry.py).
     5. No empty line should be under vehicle line name in the sheet.
 """
 
-vehicle_lines = ['Aviator', 'Bronco', 'Bronco Sport', 'Corsair',
-                 'Econoline', 'Edge', 'Escape', 'Expedition',
-                 'Explorer', 'Motorhome', 'F-150', 'Maverick', 'Medium Truck',
-                 'Mustang', 'Mustang Mach E', 'Navigator', 'Ranger',
-                 'Super Duty', 'Transit', 'Transit Connect']
-
-# path to main excel file
-path = get_path_to_df()
-no_fuel_type_vehicles, fuel_type_vehicles, sub_fuel_type_vehicles = get_vehicles_and_their_types()
 dir_to_save = 'csvs_generated/'  # to save new csvs
-if not os.path.exists(dir_to_save):
-    os.mkdir(dir_to_save)
-
-with open('missing_csvs.txt', 'w') as f:
-    for vehicle in tqdm(vehicle_lines):
-        print(vehicle)
-
-        wb = load_workbook(path)
-        # read original sheet
-       # df = pd.read_excel(path, vehicle, header=None)
-
-        # initialize an object with correct corresponding class
-        if vehicle in no_fuel_type_vehicles:
-            parser_obj = Parser(wb, vehicle)
-        if vehicle in fuel_type_vehicles:
-            parser_obj = FuelTypesParser(wb, vehicle)
-        if vehicle in sub_fuel_type_vehicles:
-            parser_obj = SubFuelTypesParser(wb, vehicle)
-
-        try:
-            # parse the sheet and save a csv
-            parser_obj = parser_obj.run(dir_to_save)
-        except Exception as e:
-            # write vehicle line names to txt files where the scrapper doesn't work
-            f.write(vehicle + '\n')
-            traceback.print_exc()
-            print(f'error in {vehicle}, error: {e}')
 
+# the vehicle lines of the main excel file in the order of the workbook: every sheet with a model year table
+# that is not in "sheets to skip". The sheets are streamed from the xlsx zip whatever the reader engine, and a
+# vehicle line only up to its first model year
+def get_vehicle_lines(config):
+    vehicle_lines = []
+    with XlsxStreamSession(config.path_to_main_excel) as session:
+        for sheet_name in session.sheet_paths:
+            if sheet_name in config.sheets_to_skip:
+                continue
+            if has_model_year_table(session, sheet_name, config):
+                vehicle_lines.append(sheet_name)
+            else:
+                print(f'{sheet_name}: no model year table, not a vehicle line')
+    return vehicle_lines
+
+
+# outcome of one sheet: the error if it failed, the fingerprint of the sheet,
+# the csv (or parquet file) it was saved to and whether it was skipped because it has not changed
+ParseResult = namedtuple('ParseResult', ['error_message', 'error_traceback', 'fingerprint', 'csv_name', 'skipped'])
+
+
+# parse one sheet and save its file, unless the sheet is the same as when its file was last written
+def parse_vehicle_line(session, vehicle, config, cache, force=False, file_format='csv', report=None):
+    report = report if report is not None else RunReport()
+    fingerprint = None
+    try:
+        with report.profile(vehicle):
+            with report.stage(vehicle, 'fingerprint'):
+                fingerprint = get_sheet_fingerprint(session, vehicle, config)
+            if not force and cache.is_unchanged(vehicle, fingerprint, dir_to_save, file_format):
+                return ParseResult(None, None, fingerprint, None, True)
+            with report.stage(vehicle, 'get_unhidden_rows') as record:
+                parser_obj = get_parser_obj(session, vehicle, config)
+                record['rows'] = len(parser_obj.header_rows)
+            parser_obj.run(dir_to_save, file_format, report)
+        return ParseResult(None, None, fingerprint, parser_obj.get_file_name(file_format), False)
+    except Exception as e:
+        return ParseResult(f'error in {vehicle}, error: {e}', traceback.format_exc(), fingerprint, None, False)
+    finally:
+        # the sheet has been parsed, free it
+        session.release(vehicle)
+
+
+# open the workbook, the time it takes is recorded in the report
+def open_session(config, report):
+    with report.stage(None, 'workbook load'):
+        return open_workbook_session(config)
+
+
+# runs inside a worker process: open the workbook and parse this worker's share of sheets,
+# the stages are recorded here and returned to the main process that writes the report
+def parse_share_of_vehicle_lines(vehicles, force, file_format, report_path, profile_vehicle_line, track_memory):
+    config = load_config()
+    cache = FingerprintCache()
+    report = RunReport(report_path, 'main', profile_vehicle_line, track_memory)
+    results = {}
+    with open_session(config, report) as session:
+        for vehicle in vehicles:
+            results[vehicle] = parse_vehicle_line(session, vehicle, config, cache, force, file_format, report)
+    return results, report.records
+
+
+# parse all the sheets one after another using a single workbook session
+def parse_sequentially(config, vehicle_lines, cache, force, file_format, report):
+    results = {}
+    with open_session(config, report) as session:
+        for vehicle in tqdm(vehicle_lines):
+            print(vehicle)
+            results[vehicle] = parse_vehicle_line(session, vehicle, config, cache, force, file_format, report)
+    return results
+
+
+# split the sheets into one share per worker and parse the shares in a process pool
+def parse_in_parallel(vehicle_lines, workers, force, file_format, report):
+    # interleave the shares so the big sheets do not all land on the same worker
+    shares = [vehicle_lines[i::workers] for i in range(workers)]
+    shares = [share for share in shares if share]
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(shares)) as executor:
+        futures = [executor.submit(parse_share_of_vehicle_lines, share, force, file_format, report.report_path,
+                                   report.profile_vehicle_line, report.track_memory)
+                   for share in shares]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            share_results, records = future.result()
+            results.update(share_results)
+            report.add_records(records)
+    return results
+
+
+# report failures in vehicle_lines order, so the output does not depend on scheduling
+def report_results(results, vehicle_lines):
+    with open('missing_csvs.txt', 'w') as f:
+        for vehicle in vehicle_lines:
+            result = results[vehicle]
+            if result.error_message is not None:
+                # write vehicle line names to txt files where the scrapper doesn't work
+                f.write(vehicle + '\n')
+                print(result.error_traceback)
+                print(result.error_message)
+
+
+# remember the fingerprints of the sheets parsed successfully and report the cache hits
+def update_fingerprint_cache(cache, results):
+    for vehicle, result in results.items():
+        if result.error_message is None and not result.skipped:
+            cache.set(vehicle, result.fingerprint, result.csv_name)
+    cache.save()
+
+
+def print_cache_summary(results):
+    hits = sum(result.skipped for result in results.values())
+    print(f'fingerprint cache: {hits} hits, {len(results) - hits} misses')
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Parse the vehicle line sheets of the main excel file into csvs')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='number of worker processes to parse the sheets with (default: 1, no pool)')
+    arg_parser.add_argument('--force', action='store_true',
+                            help='parse every sheet, even the ones that have not changed since their csv was written')
+    arg_parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                            help='save the tables as csvs, or as parquet files with typed date columns (needs pyarrow)')
+    arg_parser.add_argument('--report', metavar='PATH',
+                            help='append the time, rows, columns and peak memory of every stage of every sheet '
+                                 'to this JSON lines file')
+    arg_parser.add_argument('--no-memory', action='store_true',
+                            help='leave the peak memory out of the report, tracing the allocations slows the run down')
+    arg_parser.add_argument('--profile', metavar='VEHICLE_LINE',
+                            help='profile the parsing of this vehicle line with cProfile')
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    # path to main excel file, vehicle line types and keywords to compare
+    config = load_config()
+    if not os.path.exists(dir_to_save):
+        os.mkdir(dir_to_save)
 
+    cache = FingerprintCache()
+    report = RunReport(args.report, 'main', args.profile, track_memory=not args.no_memory)
+    vehicle_lines = get_vehicle_lines(config)
+    if args.workers > 1:
+        results = parse_in_parallel(vehicle_lines, args.workers, args.force, args.format, report)
+    else:
+        results = parse_sequentially(config, vehicle_lines, cache, args.force, args.format, report)
+    report_results(results, vehicle_lines)
+    update_fingerprint_cache(cache, results)
+    print_cache_summary(results)
+    report.save()
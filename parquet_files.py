@@ -0,0 +1,86 @@
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+"""
+Parquet output of the parsed tables, as an alternative to the csvs:
+    1. Columns whose every value is a date get a real date type, the rest stay strings.
+    2. The columns that repeat the same few values on every row are dictionary encoded.
+    3. The loader gets the tables back as text, the way they are in the csvs, without parsing any text.
+Needs pyarrow.
+"""
+
+# repeated on every row of a vehicle line, only a handful of distinct values each
+DICTIONARY_COLUMNS = ('vehicle_line', 'fuel_type', 'sub_fuel_type', 'model_year')
+
+# the format check_and_convert_datetime_object writes the dates in
+DATE_FORMAT = '%m/%d/%Y'
+
+
+def ensure_pyarrow_is_installed():
+    if pa is None:
+        raise ImportError('pyarrow is needed to read and write parquet files, install it with: pip install pyarrow')
+
+
+# the values of a column as dates, or None if any non-empty value is not a date written as DATE_FORMAT
+def get_date_column_values(column_values):
+    filled = column_values != ''
+    if not filled.any():
+        return None
+    dates = pd.to_datetime(column_values.where(filled), format=DATE_FORMAT, errors='coerce')
+    # the date has to give back the exact text, so the csv and the parquet file hold the same values
+    if not (dates[filled].dt.strftime(DATE_FORMAT) == column_values[filled]).all():
+        return None
+    return dates.dt.date.where(filled, None)
+
+
+# the final df of a parser with a type for every column, empty dates become nulls
+def get_typed_df(final_df):
+    typed_columns = {}
+    for column in final_df.columns:
+        column_values = final_df[column]
+        if column in DICTIONARY_COLUMNS:
+            typed_columns[column] = column_values.astype(str).astype('category')
+            continue
+        date_values = get_date_column_values(column_values)
+        typed_columns[column] = date_values if date_values is not None else column_values.astype(str)
+    return pd.DataFrame(typed_columns)
+
+
+def write_parquet(final_df, path):
+    ensure_pyarrow_is_installed()
+    table = pa.Table.from_pandas(get_typed_df(final_df), preserve_index=False)
+    # the tables are read back through arrow, the pandas metadata would only add a couple of KB to every file
+    pq.write_table(table.replace_schema_metadata(None), path)
+
+
+# dates as DATE_FORMAT text, a column only has a few distinct dates so only those are formatted
+def format_dates(column):
+    distinct_dates = pc.unique(column)
+    distinct_texts = pc.strftime(distinct_dates.cast(pa.timestamp('s')), format=DATE_FORMAT)
+    return pc.take(distinct_texts, pc.index_in(column, value_set=distinct_dates))
+
+
+# read a parquet file back as a df of strings, dates written as DATE_FORMAT and nulls as empty strings
+def read_parquet_as_text(path):
+    ensure_pyarrow_is_installed()
+    table = pq.read_table(path)
+    text_columns = []
+    for column in table.columns:
+        if pa.types.is_date(column.type):
+            column = format_dates(column)
+        elif pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        text_columns.append(pc.fill_null(column, ''))
+    return pa.table(text_columns, names=table.column_names).to_pandas()
+
+
+# the column names of a parquet file, only its footer is read
+def read_parquet_columns(path):
+    ensure_pyarrow_is_installed()
+    return pq.read_schema(path).names
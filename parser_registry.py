@@ -0,0 +1,68 @@
+from itertools import islice
+from Config import split_config_values
+from Parser import Parser
+from FuelTypesParser import FuelTypesParser
+from SubFuelTypesParser import SubFuelTypesParser
+
+"""
+Chooses the parser of a vehicle line sheet. The vehicle line types in config.yaml
+are looked up by the exact sheet name, a sheet that is not in the config has its
+type detected from its first unhidden rows:
+    no fuel types   the vehicle line name alone in the first row
+    fuel types      the fuel types next to the vehicle line name in the first row
+    sub-fuel types  a plant next to the vehicle line name and the sub-fuel types in the second row
+"""
+
+# the parser of every vehicle line type, by its name under "vehicle line types" in config.yaml
+parser_classes = {'no fuel types': Parser, 'fuel types': FuelTypesParser, 'sub-fuel types': SubFuelTypesParser}
+
+
+# vehicle line name -> vehicle line type, for the vehicle lines listed in the config
+def get_configured_vehicle_line_types(config):
+    configured_types = {}
+    for vehicle_line_type, vehicle_line_names in (('no fuel types', config.no_fuel_types),
+                                                  ('fuel types', config.fuel_types),
+                                                  ('sub-fuel types', config.sub_fuel_types)):
+        for vehicle_line_name in split_config_values(vehicle_line_names):
+            configured_types[vehicle_line_name] = vehicle_line_type
+    return configured_types
+
+
+def is_header_value(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+# the header values of a row are the ones after the vehicle line name and its empty neighbour
+def has_header_values(row):
+    return any(is_header_value(value) for value in row[2:])
+
+
+# detect the vehicle line type from the first two unhidden rows, the rest of the sheet is not read
+def detect_vehicle_line_type(session, vehicle_line_name):
+    first_rows = list(islice(session.iter_unhidden_rows(vehicle_line_name), 2))
+    if len(first_rows) == 2:
+        second_row = first_rows[1]
+        # the second row of the other sheets starts the first model year table
+        if second_row and second_row[0] is None and has_header_values(second_row):
+            return 'sub-fuel types'
+    if first_rows and has_header_values(first_rows[0]):
+        return 'fuel types'
+    return 'no fuel types'
+
+
+# a vehicle line sheet has a model year in the first column of a row, the sheet is read up to that row
+def has_model_year_table(session, sheet_name, config):
+    return any(row and isinstance(row[0], str) and row[0].strip() in config.model_years
+               for row in session.iter_unhidden_rows(sheet_name))
+
+
+def get_vehicle_line_type(session, vehicle_line_name, config):
+    vehicle_line_type = get_configured_vehicle_line_types(config).get(vehicle_line_name)
+    if vehicle_line_type is None:
+        vehicle_line_type = detect_vehicle_line_type(session, vehicle_line_name)
+    return vehicle_line_type
+
+
+# initialize an object with correct corresponding class, exactly one per sheet
+def get_parser_obj(session, vehicle, config):
+    return parser_classes[get_vehicle_line_type(session, vehicle, config)](session, vehicle, config)
@@ -0,0 +1,123 @@
+import os
+import time
+import queue
+import argparse
+import threading
+import traceback
+import psycopg2
+from tqdm import tqdm
+from utilities import load_config, open_workbook_session
+from Parser import get_name_to_save
+from FingerprintCache import FingerprintCache, get_sheet_fingerprint
+from main import (get_vehicle_lines, dir_to_save, ParseResult, get_parser_obj, report_results,
+                  update_fingerprint_cache, print_cache_summary)
+from updateDB import (load_table, get_connection_params, print_timings, create_fingerprint_table,
+                      get_loaded_fingerprints)
+
+"""
+Parse the sheets and load them into the DB in one go, without the csv round trip:
+    1. The main thread parses the sheets one after another and puts every final df in a bounded queue.
+    2. A loader thread takes the dfs off the queue and loads them, so loading sheet N overlaps
+       with parsing sheet N+1.
+    3. The csvs are only written with --csv.
+    4. Sheets whose fingerprint matches the one their table was loaded from are not parsed at all.
+"""
+
+
+# the table is loaded from this very sheet, and so is the csv if we are writing csvs
+def is_sheet_unchanged(vehicle, fingerprint, loaded_fingerprints, cache, write_csvs):
+    table_unchanged = loaded_fingerprints.get('preorder_' + get_name_to_save(vehicle)) == fingerprint
+    return table_unchanged and (not write_csvs or cache.is_unchanged(vehicle, fingerprint, dir_to_save))
+
+
+# parse every changed sheet and hand its final df to the loader, returns the outcome of every sheet like main.py does
+def parse_sheets(config, vehicle_lines, data_queue, args, loaded_fingerprints, cache):
+    results = {}
+    try:
+        with open_workbook_session(config) as session:
+            for vehicle in tqdm(vehicle_lines):
+                fingerprint = None
+                try:
+                    fingerprint = get_sheet_fingerprint(session, vehicle, config)
+                    if not args.force and is_sheet_unchanged(vehicle, fingerprint, loaded_fingerprints, cache, args.csv):
+                        results[vehicle] = ParseResult(None, None, fingerprint, None, True)
+                        continue
+                    parser_obj = get_parser_obj(session, vehicle, config)
+                    final_df = parser_obj.run(dir_to_save if args.csv else None)
+                    csv_name = parser_obj.get_file_name()
+                    # blocks while the loader is queue-size tables behind
+                    data_queue.put((csv_name, final_df, fingerprint))
+                    results[vehicle] = ParseResult(None, None, fingerprint, csv_name, False)
+                except Exception as e:
+                    results[vehicle] = ParseResult(f'error in {vehicle}, error: {e}', traceback.format_exc(),
+                                                   fingerprint, None, False)
+                finally:
+                    session.release(vehicle)
+    finally:
+        # no more sheets
+        data_queue.put(None)
+    return results
+
+
+# load the dfs as they come off the queue, until parse_sheets says it is done
+def load_dfs(config, data_queue, args, connection, timings):
+    while True:
+        item = data_queue.get()
+        if item is None:
+            break
+        csv_name, final_df, fingerprint = item
+        try:
+            timings[csv_name] = load_table(csv_name, config, args, connection, table_df=final_df,
+                                           fingerprint=fingerprint)
+        finally:
+            # the tables share the connection, nothing is left uncommitted or aborted for the next one
+            connection.rollback()
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Parse the sheets of the main excel file straight into the database')
+    arg_parser.add_argument('--csv', action='store_true',
+                            help='also write the csvs to ' + dir_to_save)
+    arg_parser.add_argument('--queue-size', type=int, default=2,
+                            help='number of parsed sheets that can wait for the loader')
+    arg_parser.add_argument('--sync', action='store_true',
+                            help='write only the new columns, changed rows and deleted rows instead of reloading the tables')
+    arg_parser.add_argument('--row-by-row', action='store_true',
+                            help='insert the rows one INSERT at a time instead of a single COPY per table')
+    arg_parser.add_argument('--typed-dates', action='store_true',
+                            help='load the milestone columns holding dates as date columns, see updateDB.py')
+    arg_parser.add_argument('--force', action='store_true',
+                            help='parse and load every sheet, even the ones that have not changed since the last load')
+    args = arg_parser.parse_args()
+    if args.typed_dates and args.sync:
+        arg_parser.error('--typed-dates reloads the tables, it cannot be used with --sync')
+    return args
+
+
+if __name__ == '__main__':
+    args = get_args()
+    start_time = time.time()
+    config = load_config()
+    if args.csv and not os.path.exists(dir_to_save):
+        os.mkdir(dir_to_save)
+
+    # connect before parsing anything, so a wrong database config fails right away
+    connection = psycopg2.connect(**get_connection_params(config))
+    create_fingerprint_table(connection)
+    loaded_fingerprints = get_loaded_fingerprints(connection, args.typed_dates)
+    cache = FingerprintCache()
+    vehicle_lines = get_vehicle_lines(config)
+    data_queue = queue.Queue(maxsize=args.queue_size)
+    timings = {}
+    loader = threading.Thread(target=load_dfs, args=(config, data_queue, args, connection, timings))
+    loader.start()
+    try:
+        results = parse_sheets(config, vehicle_lines, data_queue, args, loaded_fingerprints, cache)
+    finally:
+        loader.join()
+        connection.close()
+    report_results(results, vehicle_lines)
+    if args.csv:
+        update_fingerprint_cache(cache, results)
+    print_timings(timings, time.time() - start_time)
+    print_cache_summary(results)
@@ -0,0 +1,50 @@
+import pandas as pd
+from parquet_files import DATE_FORMAT, DICTIONARY_COLUMNS
+
+"""
+Typed dates for the database tables (updateDB.py --typed-dates):
+    1. A milestone column with at least one date in it becomes a date column, the dates are the cells
+       check_and_convert_datetime_object wrote as DATE_FORMAT, so they are the date cells of the workbook.
+    2. The other text of the column (TBD, N/A, Please review Quarterly table below, ...) goes to a note
+       column next to it, <column>_note, so nothing from the sheet is lost.
+    3. Empty cells are NULL in both.
+"""
+
+NOTE_SUFFIX = '_note'
+
+# postgres cuts names at 63 bytes, the note column of a long column name is cut before the suffix so the
+# two names stay apart
+def get_note_column_name(column):
+    return column.encode('utf-8')[:63 - len(NOTE_SUFFIX)].decode('utf-8', 'ignore') + NOTE_SUFFIX
+
+
+# the dates of a column and the notes next to them, or None if the column has no dates
+def get_dates_and_notes(column_values):
+    text_values = column_values.astype(object).where(column_values.notna(), '').astype(str)
+    # an empty cell is an empty string, N/A and the rest of the text are notes
+    filled = text_values != ''
+    if not filled.any():
+        return None
+    dates = pd.to_datetime(text_values.where(filled), format=DATE_FORMAT, errors='coerce')
+    # the date has to give back the exact text, "4/17 -5/15" or a date typed in as text stays a note
+    is_date = filled & dates.notna() & (dates.dt.strftime(DATE_FORMAT) == text_values)
+    if not is_date.any():
+        return None
+    return dates.dt.date.where(is_date, None), text_values.where(filled & ~is_date, None)
+
+
+# the df with every milestone column that has dates split into a date column and its note column,
+# returns the df and the names of the date columns
+def get_typed_date_df(table_df):
+    typed_columns = {}
+    date_columns = []
+    for column in table_df.columns:
+        dates_and_notes = None
+        if column != 'serial_key' and column not in DICTIONARY_COLUMNS:
+            dates_and_notes = get_dates_and_notes(table_df[column])
+        if dates_and_notes is None:
+            typed_columns[column] = table_df[column]
+            continue
+        typed_columns[column], typed_columns[get_note_column_name(column)] = dates_and_notes
+        date_columns.append(column)
+    return pd.DataFrame(typed_columns), date_columns
@@ -1,41 +1,169 @@
+import io
+import hashlib
 import glob
+import argparse
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import pandas as pd
 import os
-import yaml
 import time
 import traceback
 import psycopg2
 from psycopg2 import Error
 import psycopg2.sql as sql
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from utilities import load_config
+from FingerprintCache import FingerprintCache
+from LoadCheckpoint import LoadCheckpoint
+from parquet_files import read_parquet_as_text, read_parquet_columns
+from typed_dates import get_typed_date_df, get_note_column_name
+from RunReport import RunReport
+from Parser import get_name_to_save
 
 """
-DB operations:
+DB operations (with --sync, otherwise every table is dropped and loaded again):
     1. Update the common columns
     2. Add new columns where necessary
     3. Delete the rows which do not exist in the new sheet
 """
 
 
+# content hash of a row, used to find the rows that changed since the last load
+def get_row_hash(row_values):
+    row_text = '\x1f'.join('\x00' if value is None else str(value) for value in row_values)
+    return hashlib.md5(row_text.encode('utf-8')).hexdigest()
+
+
+# fingerprints of the sheets the preorder tables were loaded from, to skip the unchanged ones, and whether
+# the tables were loaded with typed dates: a table loaded the other way is loaded again even if its sheet
+# has not changed. Every committed load sets loaded_at, also without a fingerprint (a csv that is not in
+# sheet_fingerprints.json), so PreorderLookup knows to read the table again
+FINGERPRINT_TABLE = 'sheet_fingerprints'
+
+
+def create_fingerprint_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} ("
+                   "table_name character varying PRIMARY KEY, "
+                   "fingerprint character varying, "
+                   "loaded_at timestamp with time zone NOT NULL DEFAULT now())")
+    # the table of a database set up before the typed dates, or before the loads without a fingerprint
+    cursor.execute(f"ALTER TABLE {FINGERPRINT_TABLE} "
+                   "ADD COLUMN IF NOT EXISTS typed_dates boolean NOT NULL DEFAULT false")
+    cursor.execute(f"ALTER TABLE {FINGERPRINT_TABLE} ALTER COLUMN fingerprint DROP NOT NULL")
+    connection.commit()
+
+
+# fingerprint of every table loaded with (or without) typed dates, by table name
+def get_loaded_fingerprints(connection, typed_dates=False):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT table_name, fingerprint FROM {FINGERPRINT_TABLE} WHERE typed_dates = %s", (typed_dates,))
+    loaded_fingerprints = dict(cursor.fetchall())
+    connection.commit()
+    return loaded_fingerprints
+
+
+def get_connection_params(config):
+    data = config.database_details
+    return dict(user=data['user'],
+                password=data['password'],
+                host=data['host'],
+                port=data['port'],
+                database=data['database'])
+
+
+# postgres cuts identifiers longer than 63 bytes, some of the long column names from the sheets get cut
+def get_db_column_name(column):
+    return column.encode('utf-8')[:63].decode('utf-8', 'ignore')
+
+
+# columns of every table that exists, by table name, from the catalog in a single query without reading any rows
+def get_columns_of_tables(cursor, table_names):
+    cursor.execute("SELECT c.relname, a.attname FROM pg_catalog.pg_attribute a "
+                   "JOIN pg_catalog.pg_class c ON c.oid = a.attrelid "
+                   "WHERE a.attrelid = ANY(SELECT to_regclass(table_name) FROM unnest(%s::text[]) AS table_name) "
+                   "AND a.attnum > 0 AND NOT a.attisdropped "
+                   "ORDER BY c.relname, a.attnum", (list(table_names),))
+    columns_of_tables = {}
+    for table_name, column in cursor.fetchall():
+        columns_of_tables.setdefault(table_name, []).append(column)
+    return columns_of_tables
+
+
+# columns of a table that were loaded as dates (--typed-dates)
+def get_date_columns_of_table(cursor, table_name):
+    cursor.execute("SELECT attname FROM pg_catalog.pg_attribute "
+                   "WHERE attrelid = to_regclass(%s) AND atttypid = 'date'::regtype "
+                   "AND attnum > 0 AND NOT attisdropped", (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+# select list giving the columns of a table back as text, the way the parser wrote them: every date column of a
+# --typed-dates load merged with its note column, the dates written in date_format (a to_char pattern)
+def get_text_columns_sql(columns, date_columns, date_format='MM/DD/YYYY'):
+    note_columns = {get_note_column_name(col) for col in date_columns}
+    select_columns = []
+    for col in columns:
+        if col in date_columns:
+            note_column = get_note_column_name(col)
+            note = sql.Identifier(note_column) if note_column in columns else sql.SQL('NULL')
+            select_columns.append(sql.SQL("COALESCE(to_char({col}, {date_format}), {note}) AS {col}").format(
+                col=sql.Identifier(col), date_format=sql.Literal(date_format), note=note))
+        elif col not in note_columns:
+            select_columns.append(sql.Identifier(col))
+    return sql.SQL(', ').join(select_columns)
+
+
+# columns of the df that the table does not have yet, and columns of the table that are not in the df
+def get_column_drift(df_columns, db_columns):
+    df_db_columns = {get_db_column_name(col) for col in df_columns}
+    new_columns = [col for col in df_columns if get_db_column_name(col) not in db_columns]
+    dropped_columns = [col for col in db_columns if col not in df_db_columns]
+    return new_columns, dropped_columns
+
+
 class UpdateDB():
 
-    def __init__(self, df_path):
+    # df_path is the path of the csv to load, or, when the df is handed over directly as table_df,
+    # just the name of the table's csv
+    def __init__(self, df_path, config, bulk_load=True, connection=None, defer_commit=False, table_df=None,
+                 fingerprint=None, report=None, typed_dates=False):
+        self.config = config
+        # records the time, size and memory of every stage of the load
+        self.report = report if report is not None else RunReport()
+        self.table_df = table_df
+        # fingerprint of the sheet the df was parsed from, recorded in DB along with the data
+        self.fingerprint = fingerprint
+        # COPY the whole df in one go, or fall back to one INSERT per row
+        self.bulk_load = bulk_load
+        # load the milestone columns that hold dates as date columns with a note column next to them
+        self.typed_dates = typed_dates
+        # the date columns of the df being loaded, found by get_typed_date_df
+        self.date_columns = []
+        # the rows written and deleted by a sync
+        self.num_of_changed_rows = 0
+        self.num_of_deleted_rows = 0
+        # a connection borrowed from a pool is given back by the caller, we only close the ones we open
+        self.owns_connection = connection is None
+        # leave the transaction open, the caller commits (or rolls back) all the tables together
+        self.defer_commit = defer_commit
+        # set when any of the db operations fails
+        self.failed = False
         # Create a connection to postgres DB
-        self.connection = self.connect_to_db()
+        self.connection = self.connect_to_db() if connection is None else connection
         # Create a cursor to perform database operations
         self.cursor = self.connection.cursor()
         self.df_path = df_path
         self.tbl_name = self.get_tbl_name()
+        # the name of the csv without its extension, the stages of this table are recorded under it
+        self.report_name = os.path.splitext(os.path.basename(self.df_path))[0]
 
 
     def connect_to_db(self):
         try:
-            data = self.read_config_yaml()
-            connection = psycopg2.connect(user=data['user'],
-                                          password=data['password'],
-                                          host=data['host'],
-                                          port=data['port'],
-                                          database=data['database'])
+            connection = psycopg2.connect(**get_connection_params(self.config))
 
             print("PostgreSQL server connection opened\n")
             return connection
@@ -43,34 +171,105 @@ class UpdateDB():
         except Exception as error:
             print("Error while connecting to PostgreSQL", error)
 
-    def read_config_yaml(self):
-        with open("config.yaml", "r") as yamlfile:
-            cfg = yaml.load(yamlfile, Loader=yaml.FullLoader)
-        return cfg['database_details']
+    def commit(self):
+        if not self.defer_commit:
+            self.connection.commit()
+
+    def rollback(self):
+        self.failed = True
+        if not self.defer_commit:
+            self.connection.rollback()
+
+    def close_connection(self):
+        if self.owns_connection:
+            self.connection.close()
+            print("PostgreSQL server connection closed\n")
+
+    # fingerprint of the sheet the table was last loaded from, None if it was not loaded the same way
+    def get_loaded_fingerprint(self):
+        self.cursor.execute(f"SELECT fingerprint FROM {FINGERPRINT_TABLE} WHERE table_name = %s AND typed_dates = %s",
+                            (self.tbl_name, self.typed_dates))
+        row = self.cursor.fetchone()
+        return row[0] if row is not None else None
+
+    # called right before the data is committed, so the fingerprint is only there if the data is. A table
+    # loaded without a fingerprint gets NULL, so the fingerprint of an older load does not make it look unchanged
+    def record_fingerprint(self):
+        if self.failed:
+            return
+        query = (f"INSERT INTO {FINGERPRINT_TABLE} (table_name, fingerprint, typed_dates) VALUES (%s, %s, %s) "
+                 "ON CONFLICT (table_name) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, "
+                 "typed_dates = EXCLUDED.typed_dates, loaded_at = now()")
+        try:
+            self.cursor.execute(query, (self.tbl_name, self.fingerprint, self.typed_dates))
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot record the fingerprint of table {self.tbl_name}. Error:', error)
+            self.rollback()
+            traceback.print_exc()
 
     def get_tbl_name(self):
         tbl_name = "preorder_" + os.path.splitext(os.path.basename(self.df_path))[0]
         return tbl_name
 
     def get_df_from_csv(self):
-        df = pd.read_csv(self.df_path)  # dataframe of the csv
-        df = df.astype(str)
+        # every value as the text the parser wrote, N/A stays N/A and empty cells stay empty strings,
+        # like the parquet files and the dfs pipeline.py hands over
+        df = pd.read_csv(self.df_path, dtype=str, keep_default_na=False)  # dataframe of the csv
         return df
 
+    # df to load, read from the csv (or parquet file) unless it was handed over in memory
+    def get_df(self):
+        if self.table_df is not None:
+            return self.table_df
+        if self.df_path.endswith('.parquet'):
+            return read_parquet_as_text(self.df_path)
+        return self.get_df_from_csv()
+
+    # columns of the df to load, only the header of the csv (or the footer of the parquet file) is read
+    def get_df_columns(self):
+        if self.table_df is not None:
+            return list(self.table_df.columns)
+        if self.df_path.endswith('.parquet'):
+            return read_parquet_columns(self.df_path)
+        return list(pd.read_csv(self.df_path, nrows=0).columns)
+
+    # stream the result of a query through a server-side cursor, fetch_size rows per round trip,
+    # yields the column names and the rows of every batch
+    def iter_row_batches_from_db(self, query, fetch_size=None):
+        fetch_size = fetch_size or self.config.fetch_size
+        cursor = self.connection.cursor(name=f'read_{uuid.uuid4().hex}')
+        cursor.itersize = fetch_size
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield [desc[0] for desc in cursor.description], rows
+        finally:
+            cursor.close()
+
+    # the table as dfs of at most fetch_size rows, only one of them is in memory at a time
+    def iter_df_chunks_from_db(self, columns=None, fetch_size=None):
+        query = sql.SQL("SELECT {columns} FROM {tbl_name}").format(
+            columns=sql.SQL(', ').join(sql.Identifier(col) for col in columns) if columns else sql.SQL('*'),
+            tbl_name=sql.Identifier(self.tbl_name)
+        )
+        for column_names, rows in self.iter_row_batches_from_db(query, fetch_size):
+            yield pd.DataFrame(rows, columns=column_names)
+
     def get_df_from_db(self):
-        select_query = f"SELECT * FROM {self.tbl_name}"
-        self.cursor.execute(select_query)
-        rec = self.cursor.fetchall()
-        column_names = [desc[0] for desc in self.cursor.description]
-        df_tbl = pd.DataFrame(rec, columns=column_names)
-        return df_tbl
+        chunks = list(self.iter_df_chunks_from_db())
+        if not chunks:
+            return pd.DataFrame(columns=self.get_columns_of_db_table())
+        return pd.concat(chunks, ignore_index=True)
 
+    # compare the columns of the csv and of the table, from the header of the csv and the catalog only
     def compare_csv_and_db_columns(self):
-        df_csv = self.get_df_from_csv()
-        df_db = self.get_df_from_db()
-        print(df_csv.columns)
-        print(df_db.columns)
-        print(f'are columns of both the dfs same {df_csv.columns == df_db.columns}')
+        new_columns, dropped_columns = get_column_drift(self.get_df_columns(), self.get_columns_of_db_table())
+        print(f'Table {self.tbl_name}: {len(new_columns)} new columns {new_columns}, '
+              f'{len(dropped_columns)} columns no longer in the csv {dropped_columns}')
+        return new_columns, dropped_columns
 
     """
         Using this script we are inserting the data for the first time in DB, hence we are going to delete the 
@@ -80,23 +279,24 @@ class UpdateDB():
     # delete the old tables
 
     def delete_old_table(self):
-        query = f"DROP TABLE {self.tbl_name}"
+        query = f"DROP TABLE IF EXISTS {self.tbl_name}"
         try:
             self.cursor.execute(query)
             print(f'Table {self.tbl_name} dropped successfully')
 
         except (Exception, psycopg2.Error) as error:
             print(f'Cannot delete table {self.tbl_name}', error)
-            self.connection.rollback()
+            self.rollback()
             traceback.print_exc()
 
     # to insert data, we need to have a tuple that states column names and their types
 
     def set_column_with_their_types(self, column):
+        # the primary key is added once the data is in, see add_keys_to_table
         if column == "serial_key":
-            db_column = (column, 'character varying PRIMARY KEY')
+            db_column = (column, 'character varying NOT NULL')
         if column != "serial_key":
-            db_column = (column, 'character varying')
+            db_column = (column, 'date' if column in self.date_columns else 'character varying')
         return db_column
 
     def get_columns_with_their_types(self, new_df):
@@ -106,12 +306,12 @@ class UpdateDB():
             columns_with_their_types.append(column_)
         return tuple(columns_with_their_types)
 
-    def query_to_create_table_in_db(self, columns_with_their_types):
+    def query_to_create_table_in_db(self, columns_with_their_types, tbl_name=None):
         fields = []
         for col in columns_with_their_types:
             fields.append(sql.SQL("{} {}").format(sql.Identifier(col[0]), sql.SQL(col[1])))
         query = sql.SQL("CREATE TABLE {tbl_name} ( {fields} );").format(
-            tbl_name=sql.Identifier(self.tbl_name),
+            tbl_name=sql.Identifier(tbl_name or self.tbl_name),
             fields=sql.SQL(', ').join(fields)
         )
         return query
@@ -120,15 +320,24 @@ class UpdateDB():
         query = self.query_to_create_table_in_db(columns_with_their_types)
         try:
             self.cursor.execute(query)
-            self.connection.commit()
+            self.commit()
             print(f'Table {self.tbl_name} created successfully!')
 
         except (Exception, psycopg2.Error) as error:
             print('Cannot create table', error)
-            self.connection.rollback()
+            self.rollback()
             traceback.print_exc()
 
-    def insert_data_of_df(self, table_df):
+    def add_keys_to_table(self, tbl_name=None):
+        tbl_name = tbl_name or self.tbl_name
+        query = sql.SQL("ALTER TABLE {tbl_name} ADD CONSTRAINT {pkey_name} PRIMARY KEY (serial_key)").format(
+            tbl_name=sql.Identifier(tbl_name),
+            pkey_name=sql.Identifier(tbl_name + '_pkey'))
+        self.cursor.execute(query)
+
+    # row by row: one INSERT, and one round trip, per row of the df
+    def insert_data_of_df(self, table_df, tbl_name=None):
+        tbl_name = tbl_name or self.tbl_name
         try:
             columns = []
             # Comma-separated string of column names
@@ -138,7 +347,7 @@ class UpdateDB():
             param_placeholders = ','.join(['%s' for val in range(table_df.shape[1])])
 
             # INSERT command, including the two items above
-            sql_query = f"INSERT INTO {self.tbl_name} ({columns}) VALUES ({param_placeholders})"
+            sql_query = f"INSERT INTO {tbl_name} ({columns}) VALUES ({param_placeholders})"
 
             for row in table_df.values:
                 # tuple of parameter values
@@ -146,42 +355,447 @@ class UpdateDB():
                 # execute the command
                 self.cursor.execute(sql_query, param_values)
 
-            print(f'Data inserted in table {self.tbl_name} successfully!')
+            print(f'Data inserted in table {tbl_name} successfully!')
 
         except (Exception, psycopg2.Error) as error:
-            print(f'Cannot insert data in table {self.tbl_name}. Error:', error)
-            self.connection.rollback()
+            print(f'Cannot insert data in table {tbl_name}. Error:', error)
+            self.rollback()
+            traceback.print_exc()
+
+    # bulk load: stream the whole df to the server with a single COPY through an in-memory csv buffer
+    def copy_data_of_df(self, table_df, tbl_name=None):
+        tbl_name = tbl_name or self.tbl_name
+        try:
+            buffer = io.StringIO()
+            # missing values are written as \N so they are loaded as NULL, like the row by row path does,
+            # while empty strings stay empty strings
+            table_df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+            buffer.seek(0)
+
+            query = sql.SQL("COPY {tbl_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(
+                tbl_name=sql.Identifier(tbl_name),
+                columns=sql.SQL(', ').join(sql.Identifier(col) for col in table_df.columns)
+            )
+            self.cursor.copy_expert(query, buffer)
+
+            print(f'Data copied in table {tbl_name} successfully!')
+
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot copy data in table {tbl_name}. Error:', error)
+            self.rollback()
+            traceback.print_exc()
+
+    def write_data_of_df(self, table_df, tbl_name=None):
+        if self.bulk_load:
+            self.copy_data_of_df(table_df, tbl_name)
+        else:
+            self.insert_data_of_df(table_df, tbl_name)
+
+    def load_data_of_df(self, table_df):
+        self.write_data_of_df(table_df)
+        self.record_fingerprint()
+        self.commit()
+        self.close_connection()
+
+    """
+        A full reload is written to a staging table next to the live one. Readers keep seeing the live table
+        until the staging table is filled and indexed, then it is renamed in place of the live table in the
+        same transaction. A load that fails is rolled back and leaves the live table as it was.
+        """
+
+    def get_staging_tbl_name(self):
+        return self.tbl_name + '_staging'
+
+    def create_staging_table(self, table_df):
+        staging_tbl_name = self.get_staging_tbl_name()
+        try:
+            # a run that was killed half way can leave its staging table behind
+            self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {tbl_name}").format(
+                tbl_name=sql.Identifier(staging_tbl_name)))
+            self.cursor.execute(self.query_to_create_table_in_db(self.get_columns_with_their_types(table_df),
+                                                                 staging_tbl_name))
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot create table {staging_tbl_name}', error)
+            self.rollback()
+            traceback.print_exc()
+
+    # a B-tree index per date column, for range queries on the dates
+    def add_date_indexes_to_table(self, tbl_name=None):
+        tbl_name = tbl_name or self.tbl_name
+        for i, column in enumerate(self.date_columns):
+            self.cursor.execute(sql.SQL("CREATE INDEX {index_name} ON {tbl_name} ({column})").format(
+                index_name=sql.Identifier(f'{tbl_name}_date_{i}'),
+                tbl_name=sql.Identifier(tbl_name),
+                column=sql.Identifier(column)))
+
+    # the indexes are built once over all the rows, instead of being updated row by row during the load
+    def index_staging_table(self):
+        try:
+            self.add_keys_to_table(self.get_staging_tbl_name())
+            self.add_date_indexes_to_table(self.get_staging_tbl_name())
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot index table {self.get_staging_tbl_name()}', error)
+            self.rollback()
+            traceback.print_exc()
+
+    def get_indexes_of_table(self):
+        self.cursor.execute("SELECT c.relname FROM pg_catalog.pg_index i "
+                            "JOIN pg_catalog.pg_class c ON c.oid = i.indexrelid "
+                            "WHERE i.indrelid = to_regclass(%s)", (self.tbl_name,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    # replace the live table with the staging table, committed together with the fingerprint
+    def swap_staging_table(self):
+        staging_tbl_name = self.get_staging_tbl_name()
+        try:
+            self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {tbl_name}").format(
+                tbl_name=sql.Identifier(self.tbl_name)))
+            self.cursor.execute(sql.SQL("ALTER TABLE {staging_tbl_name} RENAME TO {tbl_name}").format(
+                staging_tbl_name=sql.Identifier(staging_tbl_name),
+                tbl_name=sql.Identifier(self.tbl_name)))
+            # the indexes are named after the staging table, the next staging table needs the names
+            for index_name in self.get_indexes_of_table():
+                if index_name.startswith(staging_tbl_name):
+                    self.cursor.execute(sql.SQL("ALTER INDEX {index_name} RENAME TO {new_index_name}").format(
+                        index_name=sql.Identifier(index_name),
+                        new_index_name=sql.Identifier(self.tbl_name + index_name[len(staging_tbl_name):])))
+            self.record_fingerprint()
+            self.commit()
+            print(f'Table {self.tbl_name} replaced successfully!')
+
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot replace table {self.tbl_name}', error)
+            self.rollback()
+            traceback.print_exc()
+
+    """
+        Once the tables exist, a new sheet usually changes only a few dates. Instead of rebuilding the
+        table, diff the df against it on serial_key and write only what changed.
+        """
+
+    def table_exists_in_db(self):
+        self.cursor.execute("SELECT to_regclass(%s)", (self.tbl_name,))
+        return self.cursor.fetchone()[0] is not None
+
+    def get_columns_of_db_table(self):
+        return get_columns_of_tables(self.cursor, [self.tbl_name]).get(self.tbl_name, [])
+
+    # columns of the table that were loaded as dates (--typed-dates), the text of the df cannot be upserted into them
+    def get_date_columns_of_db_table(self):
+        return get_date_columns_of_table(self.cursor, self.tbl_name)
+
+    # add the columns of the new sheet that the table does not have yet
+    def add_new_columns_to_table(self, new_columns):
+        for column in new_columns:
+            query = sql.SQL("ALTER TABLE {tbl_name} ADD COLUMN {column} character varying").format(
+                tbl_name=sql.Identifier(self.tbl_name),
+                column=sql.Identifier(column)
+            )
+            self.cursor.execute(query)
+
+    # hash of every row of the table, keyed on serial key, over the columns of the df
+    def get_row_hashes_from_db(self, columns):
+        query = sql.SQL("SELECT {columns} FROM {tbl_name}").format(
+            columns=sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+            tbl_name=sql.Identifier(self.tbl_name)
+        )
+        serial_key_index = columns.index('serial_key')
+        row_hashes = {}
+        for _, rows in self.iter_row_batches_from_db(query):
+            row_hashes.update((row[serial_key_index], get_row_hash(row)) for row in rows)
+        return row_hashes
+
+    def get_row_hashes_from_df(self, table_df):
+        serial_key_index = list(table_df.columns).index('serial_key')
+        return {row[serial_key_index]: get_row_hash(row) for row in table_df.itertuples(index=False, name=None)}
+
+    def upsert_rows_of_df(self, table_df):
+        columns = list(table_df.columns)
+        query = sql.SQL("INSERT INTO {tbl_name} ({columns}) VALUES %s "
+                        "ON CONFLICT (serial_key) DO UPDATE SET {updates}").format(
+            tbl_name=sql.Identifier(self.tbl_name),
+            columns=sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+            updates=sql.SQL(', ').join(sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(col))
+                                       for col in columns if col != 'serial_key')
+        )
+        rows = list(table_df.itertuples(index=False, name=None))
+        execute_values(self.cursor, query.as_string(self.connection), rows)
+
+    def delete_rows_from_table(self, serial_keys):
+        query = sql.SQL("DELETE FROM {tbl_name} WHERE serial_key = ANY(%s)").format(
+            tbl_name=sql.Identifier(self.tbl_name)
+        )
+        self.cursor.execute(query, (list(serial_keys),))
+
+    # diff the df against the table and apply only the differences, in one transaction. When the df the table
+    # was last synced from is still in memory (see watch.py), it is diffed instead and the table is not read
+    def sync_table_with_df(self, table_df, previous_df=None):
+        # missing values are NULL in the table
+        table_df = table_df.astype(object).where(table_df.notna(), None)
+        try:
+            new_columns, _ = get_column_drift(list(table_df.columns), self.get_columns_of_db_table())
+            self.add_new_columns_to_table(new_columns)
+
+            if previous_df is None:
+                db_hashes = self.get_row_hashes_from_db(list(table_df.columns))
+            else:
+                # the columns the previous df did not have are NULL in the table too
+                previous_df = previous_df.reindex(columns=table_df.columns)
+                db_hashes = self.get_row_hashes_from_df(previous_df.astype(object).where(previous_df.notna(), None))
+            df_hashes = self.get_row_hashes_from_df(table_df)
+            changed_rows = [db_hashes.get(serial_key) != row_hash for serial_key, row_hash in df_hashes.items()]
+            deleted_serial_keys = db_hashes.keys() - df_hashes.keys()
+            self.num_of_changed_rows = sum(changed_rows)
+            self.num_of_deleted_rows = len(deleted_serial_keys)
+
+            if any(changed_rows):
+                self.upsert_rows_of_df(table_df[changed_rows])
+            if deleted_serial_keys:
+                self.delete_rows_from_table(deleted_serial_keys)
+            self.record_fingerprint()
+            self.commit()
+            print(f'Table {self.tbl_name} synced: {len(new_columns)} columns added, '
+                  f'{sum(changed_rows)} rows upserted, {len(deleted_serial_keys)} rows deleted')
+
+        except (Exception, psycopg2.Error) as error:
+            print(f'Cannot sync table {self.tbl_name}. Error:', error)
+            self.rollback()
             traceback.print_exc()
 
-        self.connection.commit()
-        self.connection.close()
-        print("PostgreSQL server connection closed\n")
+        self.close_connection()
+
+    # read the df to load, recorded in the report
+    def read_df(self):
+        with self.report.stage(self.report_name, 'read') as record:
+            df = self.get_df()
+            self.report.set_shape(record, df)
+        return df
+
+    # load the df into a staging table and swap it in for the live table, every step recorded in the report,
+    # the steps after a failed one are skipped
+    def reload_table(self, df):
+        if self.typed_dates:
+            with self.report.stage(self.report_name, 'typed dates') as record:
+                df, self.date_columns = get_typed_date_df(df)
+                self.report.set_shape(record, df)
+        with self.report.stage(self.report_name, 'table create') as record:
+            self.create_staging_table(df)
+            record['columns'] = df.shape[1]
+        if not self.failed:
+            with self.report.stage(self.report_name, 'insert') as record:
+                self.write_data_of_df(df, self.get_staging_tbl_name())
+                self.report.set_shape(record, df)
+        if not self.failed:
+            with self.report.stage(self.report_name, 'index'):
+                self.index_staging_table()
+        if not self.failed:
+            with self.report.stage(self.report_name, 'swap'):
+                self.swap_staging_table()
+        self.close_connection()
+
+    # db operations that only write the differences, the table is created the first time and rebuilt as text
+    # when it was loaded with typed dates
+    def do_db_sync_operation(self, previous_df=None):
+        df = self.read_df()
+        if not self.table_exists_in_db():
+            self.reload_table(df)
+            return
+        date_columns = self.get_date_columns_of_db_table()
+        if date_columns:
+            print(f'Table {self.tbl_name} has {len(date_columns)} date columns from a load with --typed-dates, '
+                  f'reloading it as text instead of syncing')
+            self.reload_table(df)
+            return
+        with self.report.stage(self.report_name, 'sync') as record:
+            self.sync_table_with_df(df, previous_df)
+            self.report.set_shape(record, df)
 
     # db operations
     def do_db_operation(self):
-        #self.compare_csv_and_db_columns()
-        #  delete table, this is for one-time only
-        self.delete_old_table()
         # df to insert into db
-        df = self.get_df_from_csv()
-        # df columns to be inserted
-        df_columns_with_their_types = self.get_columns_with_their_types(df)
-        # create new table in db
-        self.create_table_of_df(df_columns_with_their_types)
-        # insert data of df in db
-        self.insert_data_of_df(df)
+        df = self.read_df()
+        # load it next to the live table and swap them
+        self.reload_table(df)
+
+
+# load one csv (or a df named after its csv) into its table with the given connection, returns the time
+# it took, whether it failed and whether it was skipped because the sheet has not changed since the last load
+def load_table(csv, config, args, connection, defer_commit=False, table_df=None, fingerprint=None, report=None):
+    start_time = time.time()
+    try:
+        update_db_obj = UpdateDB(csv, config, bulk_load=not args.row_by_row, connection=connection,
+                                 defer_commit=defer_commit, table_df=table_df, fingerprint=fingerprint, report=report,
+                                 typed_dates=args.typed_dates)
+        if fingerprint is not None and not args.force and update_db_obj.get_loaded_fingerprint() == fingerprint:
+            print(f'Table {update_db_obj.tbl_name} is up to date')
+            return time.time() - start_time, False, True
+        with update_db_obj.report.profile(update_db_obj.report_name):
+            if args.sync:
+                update_db_obj.do_db_sync_operation()
+            else:
+                update_db_obj.do_db_operation()
+        failed = update_db_obj.failed
+    except Exception as error:
+        print("Error", error)
+        traceback.print_exc()
+        failed = True
+    return time.time() - start_time, failed, False
 
 
+# every table commits on its own, on a connection borrowed from the pool for the time of its load,
+# and is checkpointed once it is committed
+def load_tables(pool, csvs, config, args, fingerprints, report=None, checkpoint=None):
+    def load_table_from_pool(csv):
+        connection = pool.getconn()
+        try:
+            return load_table(csv, config, args, connection, fingerprint=fingerprints.get(os.path.basename(csv)),
+                              report=report)
+        finally:
+            # nothing is left uncommitted if a load stopped half way
+            connection.rollback()
+            pool.putconn(connection)
+
+    timings = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(load_table_from_pool, csv): csv for csv in csvs}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            csv = futures[future]
+            timings[csv] = future.result()
+            if checkpoint is not None and not timings[csv][1]:
+                checkpoint.mark_loaded(csv)
+    return timings
 
 
-start_time = time.time()
+"""
+    All or nothing: the tables are loaded one after the other on a single connection, inside one
+    ordinary transaction, which is committed once every table loaded and rolled back as soon as one
+    fails. Nothing is left prepared on the server if the run stops half way.
+    """
+
 
-for csv in tqdm(glob.glob('./csvs_generated/*.csv')):
-    print(csv)
+def load_tables_all_or_nothing(pool, csvs, config, args, fingerprints, report=None):
+    connection = pool.getconn()
+    timings = {}
+    all_loaded = False
     try:
-        update_db_obj = UpdateDB(csv)
-        update_db_obj.do_db_operation()
-    except Exception as error:
-        print("Error", error)
-print(f'Execution time {time.time() - start_time} seconds')
+        for csv in tqdm(csvs):
+            timings[csv] = load_table(csv, config, args, connection, defer_commit=True,
+                                      fingerprint=fingerprints.get(os.path.basename(csv)), report=report)
+            if timings[csv][1]:
+                break
+        else:
+            connection.commit()
+            all_loaded = True
+    finally:
+        if not all_loaded:
+            connection.rollback()
+        pool.putconn(connection)
+    print('All tables committed' if all_loaded else 'A table failed to load, rolled back all the tables')
+    return timings
+
+
+# column drift of every table against its csv, from the headers of the csvs and one catalog query,
+# no table is read or written
+def print_column_drift(connection, csvs, config):
+    update_db_objs = [UpdateDB(csv, config, connection=connection) for csv in csvs]
+    columns_of_tables = get_columns_of_tables(connection.cursor(), [obj.tbl_name for obj in update_db_objs])
+    connection.rollback()
+    for update_db_obj in update_db_objs:
+        if update_db_obj.tbl_name not in columns_of_tables:
+            print(f'{update_db_obj.tbl_name}: not loaded yet')
+            continue
+        new_columns, dropped_columns = get_column_drift(update_db_obj.get_df_columns(),
+                                                        columns_of_tables[update_db_obj.tbl_name])
+        if not new_columns and not dropped_columns:
+            print(f'{update_db_obj.tbl_name}: same columns')
+            continue
+        print(f'{update_db_obj.tbl_name}: new columns {new_columns}, columns no longer in the csv {dropped_columns}')
+
+
+def print_timings(timings, wall_time):
+    for csv in sorted(timings):
+        seconds, failed, skipped = timings[csv]
+        print(f'{os.path.basename(csv)}: {seconds:.2f} seconds{" (failed)" if failed else ""}{" (unchanged)" if skipped else ""}')
+    print(f'{len(timings)} tables in {wall_time:.2f} seconds')
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Load the generated csvs into the database')
+    arg_parser.add_argument('--row-by-row', action='store_true',
+                            help='insert the rows one INSERT at a time instead of a single COPY per table')
+    arg_parser.add_argument('--sync', action='store_true',
+                            help='write only the new columns, changed rows and deleted rows instead of reloading the tables')
+    arg_parser.add_argument('--typed-dates', action='store_true',
+                            help='load the milestone columns holding dates as date columns, indexed, with the text '
+                                 'that is not a date (TBD etc.) in a <column>_note column next to them')
+    arg_parser.add_argument('--workers', type=int, default=4,
+                            help='number of tables loaded at the same time, also the size of the connection pool')
+    arg_parser.add_argument('--all-or-nothing', action='store_true',
+                            help='commit all the tables together, or none of them if any table fails, the tables are '
+                                 'loaded one after the other in a single transaction')
+    arg_parser.add_argument('--restart', action='store_true',
+                            help='load every table again, instead of resuming an interrupted run where it stopped')
+    arg_parser.add_argument('--force', action='store_true',
+                            help='load every table, even the ones whose sheet has not changed since the last load')
+    arg_parser.add_argument('--check-columns', action='store_true',
+                            help='only compare the columns of the csvs with the columns of their tables, '
+                                 'from the database catalog, and load nothing')
+    arg_parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                            help='load the csvs, or the parquet files written by main.py --format parquet')
+    arg_parser.add_argument('--report', metavar='PATH',
+                            help='append the time, rows, columns and peak memory of every stage of every table '
+                                 'to this JSON lines file, the memory only with --workers 1')
+    arg_parser.add_argument('--no-memory', action='store_true',
+                            help='leave the peak memory out of the report, tracing the allocations slows the run down')
+    arg_parser.add_argument('--profile', metavar='VEHICLE_LINE',
+                            help='profile the load of the table of this vehicle line with cProfile')
+    args = arg_parser.parse_args()
+    if args.typed_dates and args.sync:
+        arg_parser.error('--typed-dates reloads the tables, it cannot be used with --sync')
+    return args
+
+
+if __name__ == '__main__':
+    args = get_args()
+    start_time = time.time()
+    config = load_config()
+    csvs = sorted(glob.glob('./csvs_generated/*.' + args.format))
+    # fingerprints of the sheets the csvs were written from, see main.py
+    fingerprints = FingerprintCache().get_fingerprints_by_csv()
+    # tables load at the same time with more than one worker, their memory cannot be told apart
+    report = RunReport(args.report, 'updateDB', get_name_to_save(args.profile) if args.profile else None,
+                       track_memory=args.workers == 1 and not args.no_memory)
+
+    if args.check_columns:
+        connection = psycopg2.connect(**get_connection_params(config))
+        try:
+            print_column_drift(connection, csvs, config)
+        finally:
+            connection.close()
+        raise SystemExit(0)
 
+    pool = ThreadedConnectionPool(1, args.workers, **get_connection_params(config))
+    try:
+        connection = pool.getconn()
+        create_fingerprint_table(connection)
+        pool.putconn(connection)
+        if args.all_or_nothing:
+            timings = load_tables_all_or_nothing(pool, csvs, config, args, fingerprints, report)
+        else:
+            # an interrupted run is resumed, the tables it committed are not loaded again
+            checkpoint = LoadCheckpoint({'sync': args.sync, 'format': args.format, 'typed_dates': args.typed_dates})
+            if args.restart:
+                checkpoint.clear()
+            loaded_csvs = [csv for csv in csvs if checkpoint.is_loaded(csv)]
+            if loaded_csvs:
+                print(f'resuming an interrupted run, {len(loaded_csvs)} tables were already loaded')
+            timings = load_tables(pool, [csv for csv in csvs if csv not in loaded_csvs], config, args, fingerprints,
+                                  report, checkpoint)
+            if not any(failed for _, failed, _ in timings.values()):
+                checkpoint.clear()
+    finally:
+        pool.closeall()
+    print_timings(timings, time.time() - start_time)
+    hits = sum(skipped for _, _, skipped in timings.values())
+    print(f'fingerprint cache: {hits} hits, {len(timings) - hits} misses')
+    report.save()
@@ -1,17 +1,45 @@
-import yaml
+import os
+import re
+from datetime import date
+from functools import lru_cache
+from Config import Config
+from WorkbookSession import WorkbookSession
+from XlsxStreamSession import XlsxStreamSession
+
+# the classes that can read the main excel file, by their name in the config
+reader_engines = {'openpyxl': WorkbookSession, 'xml': XlsxStreamSession}
+
+
+# read config.yaml once per process, every caller after the first gets the same object
+@lru_cache(maxsize=None)
+def load_config(config_path='./config.yaml'):
+    return Config.from_yaml(config_path)
 
 
 def get_path_to_df(config_path='./config.yaml'):
-    with open(config_path, 'r') as yml_file:
-        cfg = yaml.safe_load(yml_file)
-    main_csv_path = cfg['paths']['path to main csv']
-    return main_csv_path
+    return load_config(config_path).path_to_main_excel
+
+
+# date of a workbook snapshot from its file name, "FDNB 2309 3.03.2023.xlsx" is the 3rd of March 2023
+def get_snapshot_date(path):
+    match = re.search(r'(\d{1,2})\.(\d{1,2})\.(\d{4})', os.path.basename(path))
+    if match is None:
+        return None
+    month, day, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
 
 
 def get_vehicles_and_their_types(config_path='./config.yaml'):
-    with open(config_path, 'r') as yml_file:
-        cfg = yaml.safe_load(yml_file)
-    no_fuel_types = cfg['vehicle line types']['no fuel types']
-    fuel_types = cfg['vehicle line types']['fuel types']
-    sub_fuel_types = cfg['vehicle line types']['sub-fuel types']
-    return no_fuel_types.strip(', '), fuel_types.strip(', '), sub_fuel_types.strip(', ')
+    cfg = load_config(config_path)
+    return cfg.no_fuel_types, cfg.fuel_types, cfg.sub_fuel_types
+
+
+# open the main excel file with the reader engine chosen in the config
+def open_workbook_session(config):
+    if config.reader_engine not in reader_engines:
+        raise ValueError(f'unknown reader engine {config.reader_engine!r}, '
+                         f'expected one of: {", ".join(reader_engines)}')
+    return reader_engines[config.reader_engine](config.path_to_main_excel)
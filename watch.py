@@ -0,0 +1,211 @@
+import os
+import time
+import argparse
+import traceback
+from datetime import datetime, timezone
+import psycopg2
+from utilities import load_config, open_workbook_session
+from Parser import get_name_to_save
+from FingerprintCache import get_sheet_fingerprint
+from RunReport import RunReport
+from main import get_vehicle_lines, get_parser_obj
+from updateDB import UpdateDB, get_connection_params, create_fingerprint_table, get_loaded_fingerprints
+
+"""
+Watch mode: a long running process that keeps the tables in sync with the main excel file as new
+versions of it are dropped in place:
+    1. The file is polled for a change of its modification time or size, and once it has stopped
+       changing (a drop on a share takes a while to copy) the drop is processed.
+    2. The final df of every vehicle line is kept in memory with the fingerprint of its sheet, only the
+       sheets whose fingerprint changed are parsed again.
+    3. The new df of a changed sheet is diffed against its previous df in memory, not against the table,
+       and only the new columns, changed rows and deleted rows are written, one commit per table. A table
+       that was up to date when the watch started is diffed against the table the first time its sheet
+       changes, as the df it was loaded from is not in memory.
+    4. The time from the file change (its modification time) to the last commit is printed for every
+       drop, and with --metrics appended to a JSON lines file together with the time of every step.
+The first drop is the file as it is when the watch starts, the initial load: every sheet is parsed, and the
+tables that were not loaded from the same sheets are synced against the database. The file did not change
+for it, so its time is recorded as an 'initial load' from the start of the watch, not as a latency.
+
+    python watch.py --interval 5 --metrics watch_metrics.jsonl
+"""
+
+
+# modification time and size of the file, None while it is not there (in the middle of a move)
+def get_file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# wait until the file is the same on two polls in a row
+def wait_until_settled(path, stamp, settle_seconds):
+    while True:
+        time.sleep(settle_seconds)
+        new_stamp = get_file_stamp(path)
+        if new_stamp == stamp:
+            return stamp
+        stamp = new_stamp
+
+
+class WarmParser:
+    """
+    The final df of every vehicle line and the fingerprint of the sheet it
+    was parsed from, kept in memory between drops. A vehicle line is only
+    updated once its table has the new df, so a failed load is retried
+    from the same previous df. The df is None when only the table is
+    known to match the sheet.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.frames = {}
+        self.fingerprints = {}
+
+    # parse the sheets whose fingerprint changed, returns {vehicle line: (fingerprint, final df)} and the errors
+    def parse_changed_sheets(self):
+        changed_sheets = {}
+        errors = {}
+        with open_workbook_session(self.config) as session:
+            # a sheet added to the workbook is picked up on the next drop
+            for vehicle in get_vehicle_lines(self.config):
+                try:
+                    fingerprint = get_sheet_fingerprint(session, vehicle, self.config)
+                    if self.fingerprints.get(vehicle) == fingerprint:
+                        continue
+                    changed_sheets[vehicle] = (fingerprint, get_parser_obj(session, vehicle, self.config).run())
+                except Exception as e:
+                    errors[vehicle] = f'error in {vehicle}, error: {e}'
+                finally:
+                    session.release(vehicle)
+        return changed_sheets, errors
+
+    def set(self, vehicle, fingerprint, final_df):
+        self.fingerprints[vehicle] = fingerprint
+        self.frames[vehicle] = final_df
+
+
+# write the changes of every changed sheet to its table, returns the rows written and whether every table loaded
+def push_deltas(connection, config, warm_parser, changed_sheets, loaded_fingerprints, report):
+    num_of_rows = 0
+    all_loaded = True
+    for vehicle, (fingerprint, final_df) in changed_sheets.items():
+        csv_name = get_name_to_save(vehicle) + '.csv'
+        update_db_obj = UpdateDB(csv_name, config, connection=connection, table_df=final_df, fingerprint=fingerprint,
+                                 report=report)
+        previous_df = warm_parser.frames.get(vehicle)
+        if previous_df is None and loaded_fingerprints.get(update_db_obj.tbl_name) == fingerprint:
+            # loaded from this very sheet before the watch started, but not necessarily from this df (a csv, an
+            # older version of the parser), so the next change of the sheet is diffed against the table itself
+            warm_parser.set(vehicle, fingerprint, None)
+            continue
+        # the read and sync stages of the table are recorded by do_db_sync_operation, this is the whole push
+        with report.stage(update_db_obj.report_name, 'push') as record:
+            try:
+                # diffed against the previous df when there is one, a table loaded with typed dates in the
+                # meantime is reloaded as text
+                update_db_obj.do_db_sync_operation(previous_df)
+            except Exception as error:
+                print(f'Cannot push table {update_db_obj.tbl_name}, error: {error}')
+                traceback.print_exc()
+                update_db_obj.failed = True
+            finally:
+                # the tables share the connection, the next one must not start in an aborted transaction
+                connection.rollback()
+            record['rows'] = update_db_obj.num_of_changed_rows + update_db_obj.num_of_deleted_rows
+        if update_db_obj.failed:
+            all_loaded = False
+            continue
+        num_of_rows += update_db_obj.num_of_changed_rows + update_db_obj.num_of_deleted_rows
+        warm_parser.set(vehicle, fingerprint, final_df)
+    return num_of_rows, all_loaded
+
+
+# parse and push one drop of the file, returns whether every parsed sheet made it to the database, a sheet
+# that cannot be parsed is left out until the next drop. The initial load is timed from when the watch saw
+# the file, not from its modification time
+def process_drop(connection, config, warm_parser, stamp, detected_at, report, initial=False):
+    settled_at = time.time()
+    changed_sheets, errors = warm_parser.parse_changed_sheets()
+    parsed_at = time.time()
+    for error in errors.values():
+        print(error)
+    # the fingerprints of the tables only matter for the vehicle lines that are not in memory yet
+    loaded_fingerprints = get_loaded_fingerprints(connection)
+    num_of_rows, all_loaded = push_deltas(connection, config, warm_parser, changed_sheets, loaded_fingerprints,
+                                          report)
+    committed_at = time.time()
+
+    changed_at = detected_at if initial else stamp[0] / 1e9
+    record = {'run_id': report.run_id, 'script': 'watch', 'vehicle_line': None,
+              'stage': 'initial load' if initial else 'drop',
+              'started_at': datetime.fromtimestamp(changed_at, timezone.utc).isoformat(timespec='milliseconds'),
+              'rows': num_of_rows, 'columns': None, 'seconds': round(committed_at - changed_at, 6),
+              'peak_memory_delta': None, 'changed_sheets': len(changed_sheets), 'failed_sheets': len(errors),
+              'detect_seconds': None if initial else round(detected_at - changed_at, 6),
+              'settle_seconds': round(settled_at - detected_at, 6),
+              'parse_seconds': round(parsed_at - settled_at, 6), 'push_seconds': round(committed_at - parsed_at, 6)}
+    report.add_records([record])
+    report.save()
+    if initial:
+        print(f'{datetime.now():%H:%M:%S} initial load: {len(changed_sheets)} sheets parsed, {num_of_rows} rows '
+              f'written in {record["seconds"]:.2f} seconds '
+              f'(parse {record["parse_seconds"]:.2f}, push {record["push_seconds"]:.2f})')
+    else:
+        print(f'{datetime.now():%H:%M:%S} {len(changed_sheets)} sheets changed, {num_of_rows} rows written, '
+              f'{record["seconds"]:.2f} seconds from the file change to the commit '
+              f'(parse {record["parse_seconds"]:.2f}, push {record["push_seconds"]:.2f})')
+    return all_loaded
+
+
+def get_args():
+    arg_parser = argparse.ArgumentParser(description='Keep the tables in sync with the main excel file as it changes')
+    arg_parser.add_argument('--interval', type=float, default=5, help='seconds between two polls of the file')
+    arg_parser.add_argument('--settle', type=float, default=1,
+                            help='seconds the file has to stay the same before a drop is processed')
+    arg_parser.add_argument('--metrics', metavar='PATH',
+                            help='append the latency of every drop and the time of every table sync to this '
+                                 'JSON lines file')
+    arg_parser.add_argument('--once', action='store_true', help='process the file as it is and exit')
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    config = load_config()
+    path = config.path_to_main_excel
+    report = RunReport(args.metrics, 'watch', track_memory=False)
+    warm_parser = WarmParser(config)
+
+    connection = psycopg2.connect(**get_connection_params(config))
+    create_fingerprint_table(connection)
+    print(f'watching {path} every {args.interval} seconds')
+    processed_stamp = None
+    # the file as it was when the watch started, processing it (again, after a failure) is the initial load
+    initial_stamp = None
+    retry = False
+    try:
+        while True:
+            stamp = get_file_stamp(path)
+            if stamp is not None and (stamp != processed_stamp or retry):
+                detected_at = time.time()
+                stamp = wait_until_settled(path, stamp, args.settle)
+                if stamp is not None:
+                    if connection.closed:
+                        connection = psycopg2.connect(**get_connection_params(config))
+                    if initial_stamp is None:
+                        initial_stamp = stamp
+                    # a table that failed to load is tried again on the next poll
+                    retry = not process_drop(connection, config, warm_parser, stamp, detected_at, report,
+                                             initial=stamp == initial_stamp)
+                    processed_stamp = stamp
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print('stopped watching')
+    finally:
+        connection.close()